@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -81,6 +82,34 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set RESULT_CACHE_DIR to share the cache between
+# worker processes through the file system instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'result-platform',
+    }
+}
+
+if os.environ.get('RESULT_CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['RESULT_CACHE_DIR'],
+    }
+
+# Seconds a rendered public result page stays cached. Pages are also
+# invalidated whenever the institution's results version changes.
+RESULT_PAGE_CACHE_TIMEOUT = 60 * 60
+
+
+# Tie-breakers applied after the total when ranking a class, in order. Empty
+# means students with equal totals share a rank. See results_app.ranking.
+RANK_TIE_BREAKERS = []
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -115,12 +144,32 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-import os
-
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Uploaded files (queued imports)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# How queued imports are processed: 'thread' runs them on a thread pool
+# inside the web process; 'process' leaves them to `manage.py run_import_worker`.
+IMPORT_WORKER = os.environ.get('IMPORT_WORKER', 'thread')
+IMPORT_WORKER_THREADS = 2
+# A job RUNNING for longer than this (seconds) is taken to have died with its
+# worker: it is marked FAILED and no longer blocks re-uploading the file.
+IMPORT_JOB_TIMEOUT = 60 * 60
+# Processes used to parse the sheets of a multi-sheet workbook (1 parses in-process).
+IMPORT_SHEET_WORKERS = min(4, os.cpu_count() or 1)
+
+# Generated PDF marksheets (kept between runs so regeneration is incremental).
+MARKSHEET_ROOT = MEDIA_ROOT / 'marksheets'
+MARKSHEET_WORKERS = os.cpu_count() or 1
+
+# The whole-class mark entry grid posts one field per changed cell; the
+# default of 1000 is below a full first entry for 100 students x 12 subjects.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Institution, Student, Subject, Result
+from .models import Institution, Student, Subject, Result, GradingScheme, GradingBand
 
 @admin.register(Institution)
 class InstitutionAdmin(admin.ModelAdmin):
@@ -26,3 +26,13 @@ class ResultAdmin(admin.ModelAdmin):
     list_display = ('student', 'subject', 'marks')
     search_fields = ('student__name', 'student__register_number', 'subject__name')
     list_filter = ('subject__student_class', 'subject')
+
+class GradingBandInline(admin.TabularInline):
+    model = GradingBand
+    extra = 0
+
+@admin.register(GradingScheme)
+class GradingSchemeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'institution', 'version')
+    list_filter = ('institution',)
+    inlines = [GradingBandInline]
@@ -0,0 +1,99 @@
+"""
+Exam statistics per subject.
+
+exam_statistics loads every mark of an exam (or of one class in it) in a
+single query into NumPy arrays and computes each subject's count, mean,
+median, standard deviation, range, pass rate and a histogram over the
+institution's subject grade bands, all with grouped array reductions rather
+than per-student loops. Results are cached per institution results version,
+so any change to the marks, subjects or grading scheme recomputes them.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_results_version
+from .grading import get_scheme, pass_percentage
+from .models import Subject, Result
+
+
+def _cache_key(institution, exam, student_class):
+    version = get_results_version(institution.id)
+    return f'exam-stats:{institution.id}:{exam.id}:{student_class or "all"}:{version}'
+
+
+def exam_statistics(institution, exam, student_class=None):
+    """
+    Statistics of `exam`, for every class or only `student_class`, as a
+    JSON-friendly dict. Subject marks are out of 100, as everywhere else.
+    """
+    key = _cache_key(institution, exam, student_class)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_exam_statistics(institution, exam, student_class)
+        cache.set(key, stats, settings.RESULT_PAGE_CACHE_TIMEOUT)
+    return stats
+
+
+def compute_exam_statistics(institution, exam, student_class=None):
+    results = Result.objects.filter(exam=exam, student__institution=institution)
+    subjects = Subject.objects.filter(institution=institution)
+    if student_class is not None:
+        results = results.filter(student__student_class=student_class)
+        subjects = subjects.filter(student_class=student_class)
+    rows = np.array(list(results.values_list('subject_id', 'marks')), dtype=float).reshape(-1, 2)
+    subjects = {s.id: s for s in subjects}
+
+    table = get_scheme(institution.grading_key).subject
+    pass_mark = pass_percentage(institution.grading_key)
+    # Bands are listed from the top grade down; band_indexes counts from the bottom.
+    bands = [grade for grade, _ in reversed(table.grades)]
+    stats = {
+        'exam': {'id': exam.id, 'name': exam.name},
+        'student_class': student_class,
+        'grading_system': institution.grading_system,
+        'pass_mark': pass_mark,
+        'bands': bands,
+        'subjects': [],
+    }
+    if not len(rows):
+        return stats
+
+    # Sort by subject, then marks, so every subject is one contiguous,
+    # ordered run: reduceat gives sums, run ends give min/max and median.
+    order = np.lexsort((rows[:, 1], rows[:, 0]))
+    subject_ids, marks = rows[order, 0].astype(np.int64), rows[order, 1]
+    group_ids, starts, counts = np.unique(subject_ids, return_index=True, return_counts=True)
+    ends = starts + counts - 1
+
+    means = np.add.reduceat(marks, starts) / counts
+    deviations = marks - np.repeat(means, counts)
+    stds = np.sqrt(np.add.reduceat(deviations * deviations, starts) / counts)
+    medians = (marks[starts + (counts - 1) // 2] + marks[starts + counts // 2]) / 2
+    pass_rates = np.add.reduceat((marks >= pass_mark).astype(float), starts) / counts * 100
+
+    n_bands = len(bands)
+    group_of = np.repeat(np.arange(len(group_ids)), counts)
+    band_of = n_bands - 1 - table.band_indexes(marks)
+    histograms = np.bincount(group_of * n_bands + band_of, minlength=len(group_ids) * n_bands).reshape(-1, n_bands)
+
+    for i, subject_id in enumerate(group_ids.tolist()):
+        subject = subjects.get(subject_id)
+        if subject is None:
+            # Marks of another class's subject, outside the requested class.
+            continue
+        stats['subjects'].append({
+            'subject_id': subject_id,
+            'subject': subject.name,
+            'student_class': subject.student_class,
+            'count': int(counts[i]),
+            'mean': round(float(means[i]), 2),
+            'median': round(float(medians[i]), 2),
+            'std': round(float(stds[i]), 2),
+            'min': float(marks[starts[i]]),
+            'max': float(marks[ends[i]]),
+            'pass_rate': round(float(pass_rates[i]), 1),
+            'histogram': histograms[i].tolist(),
+        })
+    stats['subjects'].sort(key=lambda s: (s['student_class'], s['subject']))
+    return stats
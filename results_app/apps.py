@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ResultsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'results_app'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,35 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Institution
+
+
+def get_results_version(institution_id):
+    """
+    Current results version of an institution. Every cached artefact derived
+    from its results is keyed by this counter, so bumping it invalidates them.
+    It lives on the Institution row so that bumps made by an import worker
+    process are seen by the web processes, whatever the cache backend.
+    """
+    return Institution.objects.filter(id=institution_id).values_list('results_version', flat=True).first()
+
+
+def bump_results_version(institution_id):
+    Institution.objects.filter(id=institution_id).update(results_version=F('results_version') + 1)
+
+
+def result_page_cache_key(institution_id, register_number):
+    version = get_results_version(institution_id)
+    register_hash = hashlib.sha1(register_number.encode()).hexdigest()
+    return f'result-page:{institution_id}:{register_hash}:{version}'
+
+
+def get_cached_result_page(institution_id, register_number):
+    return cache.get(result_page_cache_key(institution_id, register_number))
+
+
+def set_cached_result_page(institution_id, register_number, content):
+    cache.set(result_page_cache_key(institution_id, register_number), content, settings.RESULT_PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,107 @@
+"""
+Excel exports of class result matrices.
+
+Workbooks are written with openpyxl in write-only mode, which streams rows
+to disk as they are appended, into an anonymous temporary file that is then
+streamed to the client. Only one class matrix is in memory at a time, so an
+institution-wide export of any size keeps memory flat.
+"""
+import tempfile
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from .grading import grade_marks_array
+from .matrix import build_class_matrix
+from .models import Student, Subject
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def matrix_header(matrix):
+    header = ['Register Number', 'Name', 'Division']
+    for subject in matrix.subjects:
+        header.append(subject.name)
+        if _shows_grades(matrix):
+            header.append(f'{subject.name} Grade')
+    header += ['Total', 'Max Total']
+    if matrix.institution.grading_system == 'SUNNI_BOARD':
+        header.append('Result')
+    return header
+
+
+def _shows_grades(matrix):
+    return matrix.institution.grading_system != 'PERCENTAGE'
+
+
+def matrix_rows(matrix):
+    """
+    The rows of class_result.html as plain values: marks (None when not
+    entered), subject grades and the total, graded a whole column at a time.
+    """
+    n, m = len(matrix.students), len(matrix.subjects)
+    if n == 0:
+        return
+    marks = np.frombuffer(matrix.marks, dtype=float).reshape(n, m)
+    missing = np.isnan(marks)
+    grading_key = matrix.institution.grading_key
+    grades = None
+    if _shows_grades(matrix) and m:
+        grades, _ = grade_marks_array(marks.ravel(), 100, grading_key)
+        grades = grades.reshape(n, m)
+    totals = np.frombuffer(matrix.totals, dtype=float)
+    sunni_board = matrix.institution.grading_system == 'SUNNI_BOARD'
+    if sunni_board:
+        _, total_names = grade_marks_array(totals, matrix.max_total, grading_key, is_total=True)
+
+    for i, student in enumerate(matrix.students):
+        row = [student.register_number, student.name, student.division or '']
+        for j in range(m):
+            row.append(None if missing[i, j] else float(marks[i, j]))
+            if grades is not None:
+                row.append('' if missing[i, j] else grades[i, j])
+        row += [float(totals[i]), matrix.max_total]
+        if sunni_board:
+            row.append('' if not matrix.max_total else 'FAILED' if matrix.failed[i] else total_names[i])
+        yield row
+
+
+def _append_matrix(workbook, title, matrix):
+    sheet = workbook.create_sheet(title=title[:31])
+    bold = Font(bold=True)
+    header = []
+    for value in matrix_header(matrix):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = bold
+        header.append(cell)
+    sheet.append(header)
+    for row in matrix_rows(matrix):
+        sheet.append(row)
+
+
+def _save(workbook):
+    out = tempfile.TemporaryFile()
+    workbook.save(out)
+    out.seek(0)
+    return out
+
+
+def export_class_results(institution, class_num, exam):
+    """An open temporary file holding the class's results for `exam` as .xlsx."""
+    workbook = Workbook(write_only=True)
+    _append_matrix(workbook, f'Class {class_num}', build_class_matrix(institution, class_num, exam))
+    return _save(workbook)
+
+
+def export_institution_results(institution, exam):
+    """Like export_class_results, with one sheet per class of the institution."""
+    classes = set(Student.objects.filter(institution=institution).values_list('student_class', flat=True))
+    classes.update(Subject.objects.filter(institution=institution).values_list('student_class', flat=True))
+    workbook = Workbook(write_only=True)
+    for class_num in sorted(classes):
+        _append_matrix(workbook, f'Class {class_num}', build_class_matrix(institution, class_num, exam))
+    if not classes:
+        workbook.create_sheet(title='Results')
+    return _save(workbook)
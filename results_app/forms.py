@@ -1,12 +1,13 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import Student, Subject, Result, Institution, Exam
+from .models import Student, Subject, Result, Institution, Exam, GradingScheme, GradingBand, PassFailRule
 
 class InstitutionRegistrationForm(forms.ModelForm):
     institution_name = forms.CharField(max_length=255, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Adabiyya High School'}))
     password = forms.CharField(widget=forms.PasswordInput(attrs={'class': 'form-control'}))
     phone_number = forms.CharField(max_length=20, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. 9947924613'}))
-    grading_system = forms.ChoiceField(choices=Institution.GRADING_CHOICES, required=True, widget=forms.Select(attrs={'class': 'form-control'}))
+    # Custom schemes are created from the dashboard once the institution exists
+    grading_system = forms.ChoiceField(choices=[c for c in Institution.GRADING_CHOICES if c[0] != 'CUSTOM'], required=True, widget=forms.Select(attrs={'class': 'form-control'}))
     
     class Meta:
         model = User
@@ -32,10 +33,12 @@ class SingleUploadForm(forms.ModelForm):
 
 class BulkUploadForm(forms.Form):
     exam_name = forms.CharField(max_length=255, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Model Exam 2026'}))
-    file = forms.FileField(required=True, widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.xlsx, .xls'}))
+    file = forms.FileField(required=True, widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.xlsx, .xls, .csv, .tsv, .parquet'}))
+    dry_run = forms.BooleanField(required=False, label='Validate only (dry run, nothing is saved)', widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
 
 class StudentBulkUploadForm(forms.Form):
-    file = forms.FileField(required=True, widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.xlsx, .xls'}))
+    file = forms.FileField(required=True, widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.xlsx, .xls, .csv, .tsv, .parquet'}))
+    remove_missing = forms.BooleanField(required=False, label='Sync roster: remove students of these classes who are not in the file', widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
 
 class StudentForm(forms.ModelForm):
     class Meta:
@@ -61,13 +64,45 @@ class SubjectForm(forms.ModelForm):
 class InstitutionEditForm(forms.ModelForm):
     class Meta:
         model = Institution
-        fields = ['name', 'phone_number', 'grading_system']
+        fields = ['name', 'phone_number', 'grading_system', 'grading_scheme']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'phone_number': forms.TextInput(attrs={'class': 'form-control'}),
             'grading_system': forms.Select(attrs={'class': 'form-control'}),
+            'grading_scheme': forms.Select(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['grading_scheme'].queryset = GradingScheme.objects.filter(institution=self.instance)
+        self.fields['grading_scheme'].help_text = 'Used when the grading system is "Custom Grading Scheme".'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('grading_system') == 'CUSTOM' and not cleaned_data.get('grading_scheme'):
+            self.add_error('grading_scheme', 'Select the grading scheme to use.')
+        return cleaned_data
+
+class GradingSchemeForm(forms.ModelForm):
+    class Meta:
+        model = GradingScheme
+        fields = ['name']
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Term Grading 2026'}),
+        }
+
+GradingBandFormSet = forms.inlineformset_factory(
+    GradingScheme, GradingBand,
+    fields=['scope', 'min_percentage', 'grade', 'grade_name'],
+    extra=3, can_delete=True,
+    widgets={
+        'scope': forms.Select(attrs={'class': 'form-select form-select-sm'}),
+        'min_percentage': forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'step': 'any'}),
+        'grade': forms.TextInput(attrs={'class': 'form-control form-control-sm'}),
+        'grade_name': forms.TextInput(attrs={'class': 'form-control form-control-sm'}),
+    },
+)
+
 class ExamForm(forms.ModelForm):
     class Meta:
         model = Exam
@@ -75,3 +110,24 @@ class ExamForm(forms.ModelForm):
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Model Exam 2026'}),
         }
+
+class PassFailRuleForm(forms.ModelForm):
+    reset_overrides = forms.BooleanField(required=False, label='Also replace results that were set by hand', widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+
+    class Meta:
+        model = PassFailRule
+        fields = ['min_subject_marks', 'min_total_percentage']
+        labels = {
+            'min_subject_marks': 'Minimum marks in every subject',
+            'min_total_percentage': 'Minimum total percentage',
+        }
+        widgets = {
+            'min_subject_marks': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'placeholder': 'e.g. 35'}),
+            'min_total_percentage': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'placeholder': 'e.g. 40'}),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('min_subject_marks') is None and cleaned_data.get('min_total_percentage') is None:
+            raise forms.ValidationError('Set a minimum subject mark, a minimum total percentage, or both.')
+        return cleaned_data
@@ -0,0 +1,216 @@
+"""
+Table-driven grading engine.
+
+A grading scheme is a set of boundary tables, one for subject marks and
+optionally one for totals. Each table lists (minimum percentage, grade,
+grade name) rows from the highest band down; the last row has no minimum
+and catches everything below. Tables are compiled once into ascending
+threshold arrays and resolved with bisect (or numpy.searchsorted for a
+whole column of marks).
+
+Institutions can also define their own GradingScheme rows. Those are
+addressed by Institution.grading_key ("scheme:<id>:<version>") and compiled
+into a bounded, process-level LRU cache; since every band edit bumps the
+scheme version, a changed scheme simply misses the cache and stale entries
+age out.
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+GRADING_TABLES = {
+    '10_POINT': {
+        'subject': [
+            (91, 'A1', 'Outstanding'),
+            (81, 'A2', 'Excellent'),
+            (71, 'B1', 'Very Good'),
+            (61, 'B2', 'Good'),
+            (51, 'C1', 'Above Average'),
+            (41, 'C2', 'Average'),
+            (33, 'D', 'Marginal'),
+            (None, 'E', 'Needs Improvement'),
+        ],
+    },
+    '9_POINT': {
+        'subject': [
+            (90, 'A+', 'Outstanding'),
+            (80, 'A', 'Excellent'),
+            (70, 'B+', 'Very Good'),
+            (60, 'B', 'Good'),
+            (50, 'C+', 'Above Average'),
+            (40, 'C', 'Average'),
+            (30, 'D+', 'Marginal'),
+            (20, 'D', 'Needs Improvement'),
+            (None, 'E', 'Needs Improvement'),
+        ],
+    },
+    'SUNNI_BOARD': {
+        'subject': [
+            (96, 'A++', ''),
+            (91, 'A+', ''),
+            (81, 'A', ''),
+            (71, 'B+', ''),
+            (61, 'B', ''),
+            (51, 'C+', ''),
+            (40, 'C', ''),
+            (None, 'D', ''),
+        ],
+        'total': [
+            (100, 'Top', 'Top'),
+            (96, 'Topper', 'Topper'),
+            (80, 'Distinction', 'Distinction'),
+            (40, 'Pass', 'Pass'),
+            (None, 'Failed', 'Failed'),
+        ],
+    },
+    'PERCENTAGE': {
+        'subject': [
+            (33, 'Pass', ''),
+            (None, 'Fail', ''),
+        ],
+    },
+}
+
+# Grading systems without a table of their own (PASS_FAIL and anything
+# unknown) grade like PERCENTAGE.
+DEFAULT_GRADING_SYSTEM = 'PERCENTAGE'
+
+CUSTOM_SCHEME_PREFIX = 'scheme:'
+CUSTOM_SCHEME_CACHE_SIZE = 256
+
+
+class CompiledTable:
+    """One boundary table compiled for bisect lookups."""
+    __slots__ = ('bands', 'thresholds', 'grades', 'threshold_array', 'grade_array', 'name_array')
+
+    def __init__(self, bands):
+        bands = list(bands)
+        if not bands or bands[-1][0] is not None:
+            raise ValueError("A grading table must end with a catch-all band (minimum None).")
+        ascending = list(reversed(bands[:-1]))
+        thresholds = [float(band[0]) for band in ascending]
+        if any(a >= b for a, b in zip(thresholds, thresholds[1:])):
+            raise ValueError("Grading band minimums must be strictly decreasing.")
+
+        self.bands = bands
+        self.thresholds = thresholds
+        # grades[i] is the band for percentages with exactly i thresholds <= it.
+        self.grades = [(bands[-1][1], bands[-1][2])] + [(band[1], band[2]) for band in ascending]
+        self.threshold_array = np.array(thresholds, dtype=float)
+        self.grade_array = np.array([g for g, _ in self.grades], dtype=object)
+        self.name_array = np.array([n for _, n in self.grades], dtype=object)
+
+    def grade(self, percentage):
+        if percentage != percentage:  # NaN fails every ">=" test
+            return self.grades[0]
+        return self.grades[bisect_right(self.thresholds, percentage)]
+
+    def band_indexes(self, percentages):
+        indexes = np.searchsorted(self.threshold_array, percentages, side='right')
+        indexes[np.isnan(percentages)] = 0
+        return indexes
+
+
+class CompiledScheme:
+    __slots__ = ('subject', 'total')
+
+    def __init__(self, subject, total=None):
+        self.subject = CompiledTable(subject)
+        self.total = CompiledTable(total) if total else self.subject
+
+    def table(self, is_total=False):
+        return self.total if is_total else self.subject
+
+
+BUILTIN_SCHEMES = {code: CompiledScheme(**tables) for code, tables in GRADING_TABLES.items()}
+
+
+_custom_schemes = OrderedDict()
+_custom_schemes_lock = threading.Lock()
+
+
+def compile_bands(bands):
+    """
+    Compile GradingBand-like objects (scope, min_percentage, grade,
+    grade_name) into a CompiledScheme, or None if there are no subject bands.
+    """
+    tables = {'SUBJECT': [], 'TOTAL': []}
+    for band in sorted(bands, key=lambda b: -b.min_percentage):
+        tables[band.scope].append((band.min_percentage, band.grade, band.grade_name))
+    if not tables['SUBJECT']:
+        return None
+    for rows in tables.values():
+        if rows:
+            rows[-1] = (None,) + rows[-1][1:]
+    return CompiledScheme(tables['SUBJECT'], tables['TOTAL'] or None)
+
+
+def _load_custom_scheme(key):
+    from .models import GradingBand
+
+    try:
+        scheme_id = int(key[len(CUSTOM_SCHEME_PREFIX):].split(':')[0])
+    except ValueError:
+        return None
+    return compile_bands(GradingBand.objects.filter(scheme_id=scheme_id))
+
+
+def get_custom_scheme(key):
+    with _custom_schemes_lock:
+        if key in _custom_schemes:
+            _custom_schemes.move_to_end(key)
+            return _custom_schemes[key]
+    compiled = _load_custom_scheme(key)
+    with _custom_schemes_lock:
+        _custom_schemes[key] = compiled
+        while len(_custom_schemes) > CUSTOM_SCHEME_CACHE_SIZE:
+            _custom_schemes.popitem(last=False)
+    return compiled
+
+
+def clear_custom_scheme_cache():
+    with _custom_schemes_lock:
+        _custom_schemes.clear()
+
+
+def get_scheme(grading_system):
+    scheme = BUILTIN_SCHEMES.get(grading_system)
+    if scheme is None and isinstance(grading_system, str) and grading_system.startswith(CUSTOM_SCHEME_PREFIX):
+        scheme = get_custom_scheme(grading_system)
+    return scheme or BUILTIN_SCHEMES[DEFAULT_GRADING_SYSTEM]
+
+
+def pass_percentage(grading_system, is_total=False):
+    """
+    The lowest passing percentage of a scheme's subject (or total) table:
+    everything in the catch-all bottom band fails, like the 'Fail' and
+    'Failed' bands of the built-in schemes.
+    """
+    thresholds = get_scheme(grading_system).table(is_total).thresholds
+    return thresholds[0] if thresholds else 0
+
+
+def grade_percentage(percentage, grading_system, is_total=False):
+    return get_scheme(grading_system).table(is_total).grade(percentage)
+
+
+def grade_marks_array(marks, max_marks, grading_system, is_total=False):
+    """
+    Vectorized calculate_grade: grade a whole column of marks at once.
+    `max_marks` may be a scalar or an array broadcastable against `marks`.
+    Returns two object arrays, (grades, grade_names).
+    """
+    table = get_scheme(grading_system).table(is_total)
+    marks = np.atleast_1d(np.asarray(marks, dtype=float))
+    max_marks = np.broadcast_to(np.asarray(max_marks, dtype=float), marks.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = (marks / max_marks) * 100
+    indexes = table.band_indexes(percentages)
+    grades = table.grade_array[indexes]
+    names = table.name_array[indexes]
+    no_max = max_marks == 0
+    grades[no_max] = ''
+    names[no_max] = ''
+    return grades, names
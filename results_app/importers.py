@@ -0,0 +1,370 @@
+"""
+Set-based ingestion of marks sheets.
+
+Sheets arrive as pandas DataFrames (one or more chunks with the same
+columns as the Excel template: "Register Number", "Name", "Class", optional
+"Father's Name" and "Division", then one column per subject). Rows are
+validated with vectorized pandas operations, existing students, subjects and
+marks are preloaded into dicts once, and only what differs from the database
+is written, with bulk_create/bulk_update in chunks inside a single transaction.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import Student, Subject, Result
+from .signals import results_changed, batched_results_changes
+
+REGISTER_NUMBER_COLUMN = 'Register Number'
+NAME_COLUMN = 'Name'
+CLASS_COLUMN = 'Class'
+FATHERS_NAME_COLUMN = "Father's Name"
+DIVISION_COLUMN = 'Division'
+REQUIRED_COLUMNS = [REGISTER_NUMBER_COLUMN, NAME_COLUMN, CLASS_COLUMN]
+OPTIONAL_COLUMNS = [FATHERS_NAME_COLUMN, DIVISION_COLUMN]
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_SUBJECT_MARKS = 100
+# One mark per student, subject and class: later cells for the same key win.
+MARK_KEY = ['register_number', 'student_class', 'subject']
+
+
+class ImportFormatError(ValueError):
+    """The sheet itself is unusable (e.g. required columns are missing)."""
+
+
+class ImportSummary:
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_skipped = 0
+        self.students_created = 0
+        self.students_updated = 0
+        self.students_unchanged = 0
+        self.students_deleted = 0
+        self.students_kept = 0
+        self.marks_inserted = 0
+        self.marks_updated = 0
+        self.marks_unchanged = 0
+        self.marks_skipped = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __str__(self):
+        return (
+            f"{self.rows_read - self.rows_skipped} rows imported, {self.rows_skipped} skipped; "
+            f"{self.students_created} students added, {self.students_updated} updated, {self.students_deleted} removed, {self.students_kept} kept; "
+            f"{self.marks_inserted} marks inserted, {self.marks_updated} updated, {self.marks_unchanged} unchanged, "
+            f"{self.marks_skipped} invalid marks skipped."
+        )
+
+
+def normalize_columns(df):
+    df = df.copy()
+    df.columns = [str(c).strip() for c in df.columns]
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ImportFormatError('The Excel file must contain "Register Number", "Name", and "Class" columns.')
+    return df
+
+
+def subject_columns(columns):
+    fixed = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    return [c for c in columns if c not in fixed and "Unnamed" not in str(c)]
+
+
+def _text(series):
+    """Stripped strings, with blanks and NaN as None."""
+    values = series.astype(str).str.strip()
+    return values.where(~values.isin(['', 'nan']), None)
+
+
+def clean_student_rows(df):
+    """
+    Vectorized validation of the fixed columns. Returns a frame indexed like
+    `df` holding only usable rows, with columns register_number, name,
+    student_class, fathers_name and division.
+    """
+    register_numbers = _text(df[REGISTER_NUMBER_COLUMN])
+    classes = pd.to_numeric(df[CLASS_COLUMN].astype(str).str.strip(), errors='coerce')
+    valid = register_numbers.notna() & np.isfinite(classes)
+
+    rows = pd.DataFrame({
+        'register_number': register_numbers,
+        'name': _text(df[NAME_COLUMN]).fillna(''),
+        'student_class': np.trunc(classes.where(valid, 0)).astype(int),
+        'fathers_name': _text(df[FATHERS_NAME_COLUMN]) if FATHERS_NAME_COLUMN in df.columns else None,
+        'division': _text(df[DIVISION_COLUMN]) if DIVISION_COLUMN in df.columns else None,
+    }, index=df.index)
+    return rows[valid]
+
+
+def clean_marks(df, rows, subjects):
+    """
+    Long-format marks of the valid rows: one record per non-blank cell with
+    columns register_number, student_class, subject and marks (NaN where the
+    cell was not a number).
+    """
+    if not subjects or rows.empty:
+        return pd.DataFrame(columns=['register_number', 'student_class', 'subject', 'marks'])
+    cells = df.loc[rows.index, subjects].astype(str).apply(lambda col: col.str.strip())
+    cells.insert(0, 'register_number', rows['register_number'])
+    cells.insert(1, 'student_class', rows['student_class'])
+    marks = cells.melt(id_vars=['register_number', 'student_class'], var_name='subject', value_name='raw')
+    marks = marks[~marks['raw'].isin(['', 'nan'])]
+    marks['marks'] = pd.to_numeric(marks['raw'], errors='coerce')
+    return marks.drop(columns='raw')
+
+
+def valid_marks(marks):
+    """Whether each mark is a finite number between 0 and MAX_SUBJECT_MARKS."""
+    return marks.astype(float).between(0, MAX_SUBJECT_MARKS)
+
+
+class ResultImporter:
+    """
+    Imports marks sheets for one exam. Feed it DataFrame chunks with
+    `import_frame` inside `run()`; lookups are loaded once and shared by all
+    chunks.
+    """
+
+    def __init__(self, institution, exam, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.institution = institution
+        self.exam = exam
+        self.chunk_size = chunk_size
+        self.summary = ImportSummary()
+        self.touched_student_ids = set()
+        self.students = None
+        self.subjects = None
+        self.existing_marks = None
+        self.existing_versions = None
+
+    def _preload(self):
+        self.students = {s.register_number: s for s in Student.objects.filter(institution=self.institution)}
+        self.subjects = {
+            (name, student_class): subject_id
+            for subject_id, name, student_class in Subject.objects.filter(institution=self.institution).values_list('id', 'name', 'student_class')
+        }
+        # (student_id, subject_id) -> marks, so re-uploads only write what changed.
+        self.existing_marks = {}
+        self.existing_versions = {}
+        for student_id, subject_id, marks, version in Result.objects.filter(
+            exam=self.exam, student__institution=self.institution,
+        ).values_list('student_id', 'subject_id', 'marks', 'version'):
+            self.existing_marks[(student_id, subject_id)] = marks
+            self.existing_versions[(student_id, subject_id)] = version
+
+    @contextmanager
+    def session(self):
+        """
+        One transaction for everything imported inside the block. Bulk writes
+        bypass model signals, so listeners are notified once at the end, still
+        inside the transaction so snapshots and summaries commit together with
+        the marks.
+        """
+        with transaction.atomic():
+            self._preload()
+            yield self
+            if self.touched_student_ids:
+                results_changed.send(sender=Result, student_ids=self.touched_student_ids, exam_ids=[self.exam.id])
+
+    def run(self, frames, progress=None):
+        """Import every frame in one session, calling progress(rows_read) after each one."""
+        with self.session():
+            for df in frames:
+                self.import_frame(df)
+                if progress:
+                    progress(self.summary.rows_read)
+        return self.summary
+
+    def import_frame(self, df):
+        df = normalize_columns(df)
+        rows = clean_student_rows(df)
+        self.summary.rows_read += len(df)
+        self.summary.rows_skipped += len(df) - len(rows)
+
+        self._write_students(rows)
+        marks = clean_marks(df, rows, subject_columns(df.columns))
+        valid = valid_marks(marks['marks'])
+        self.summary.marks_skipped += int((~valid).sum())
+        self._write_marks(marks[valid].drop_duplicates(MARK_KEY, keep='last'))
+
+    def _write_students(self, rows):
+        # A register number repeated in the sheet behaves as if its rows were
+        # applied in order: created from the first, updated by the last.
+        first = rows.drop_duplicates('register_number', keep='first')
+        last = rows.drop_duplicates('register_number', keep='last').set_index('register_number')
+
+        new_students = []
+        changed_students = []
+        for reg, name, student_class in zip(first['register_number'], first['name'], first['student_class']):
+            fathers_name = last.at[reg, 'fathers_name']
+            division = last.at[reg, 'division']
+            student = self.students.get(reg)
+            if student is None:
+                new_students.append(Student(
+                    institution=self.institution, register_number=reg, name=name,
+                    student_class=int(student_class), fathers_name=fathers_name, division=division,
+                ))
+                continue
+            updated = False
+            if fathers_name and student.fathers_name != fathers_name:
+                student.fathers_name = fathers_name
+                updated = True
+            if division and student.division != division:
+                student.division = division
+                updated = True
+            if updated:
+                changed_students.append(student)
+
+        if new_students:
+            Student.objects.bulk_create(new_students, batch_size=self.chunk_size)
+            created = Student.objects.filter(institution=self.institution, register_number__in=[s.register_number for s in new_students])
+            for student in created:
+                self.students[student.register_number] = student
+        if changed_students:
+            Student.objects.bulk_update(changed_students, ['fathers_name', 'division'], batch_size=self.chunk_size)
+        self.summary.students_created += len(new_students)
+        self.summary.students_updated += len(changed_students)
+        self.touched_student_ids.update(s.id for s in changed_students)
+        self.touched_student_ids.update(self.students[s.register_number].id for s in new_students)
+
+    def _subject_ids(self, marks):
+        keys = [(name, int(student_class)) for name, student_class in zip(marks['subject'], marks['student_class'])]
+        missing = {key for key in keys if key not in self.subjects}
+        if missing:
+            Subject.objects.bulk_create(
+                [Subject(institution=self.institution, name=name, student_class=student_class) for name, student_class in missing],
+                batch_size=self.chunk_size, ignore_conflicts=True,
+            )
+            for subject_id, name, student_class in Subject.objects.filter(
+                institution=self.institution, name__in={name for name, _ in missing},
+            ).values_list('id', 'name', 'student_class'):
+                self.subjects[(name, student_class)] = subject_id
+        return [self.subjects[key] for key in keys]
+
+    def _write_marks(self, marks):
+        if marks.empty:
+            return
+        student_ids = {reg: student.id for reg, student in self.students.items()}
+        marks = marks.assign(
+            student_id=marks['register_number'].map(student_ids),
+            subject_id=self._subject_ids(marks),
+        ).drop_duplicates(['student_id', 'subject_id'], keep='last')
+
+        results = []
+        for student_id, subject_id, mark in zip(marks['student_id'], marks['subject_id'], marks['marks']):
+            key = (student_id, subject_id)
+            mark = float(mark)
+            previous = self.existing_marks.get(key)
+            if previous is None:
+                self.summary.marks_inserted += 1
+            elif previous == mark:
+                self.summary.marks_unchanged += 1
+                continue
+            else:
+                self.summary.marks_updated += 1
+            self.existing_marks[key] = mark
+            version = self.existing_versions[key] = self.existing_versions.get(key, 0) + 1
+            results.append(Result(student_id=student_id, subject_id=subject_id, exam=self.exam, marks=mark, version=version))
+            self.touched_student_ids.add(student_id)
+
+        for i in range(0, len(results), self.chunk_size):
+            Result.objects.bulk_create(
+                results[i:i + self.chunk_size],
+                update_conflicts=True,
+                unique_fields=['student', 'subject', 'exam'],
+                update_fields=['marks', 'version'],
+            )
+
+
+def import_results(institution, exam, frames, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Import marks sheet chunks for `exam`. Returns an ImportSummary."""
+    return ResultImporter(institution, exam, chunk_size=chunk_size).run(frames, progress=progress)
+
+
+STUDENT_FIELDS = ['name', 'student_class', 'fathers_name', 'division']
+
+
+def import_students(institution, frames, progress=None, remove_missing=False):
+    """
+    Sync the roster from sheet chunks (the fixed columns of the marks
+    template). Existing students are loaded once; new students are inserted
+    and changed ones updated in bulk, in one transaction. With
+    `remove_missing`, students of the classes in the sheet who are not listed
+    are deleted, except those whose row was skipped as invalid; if a skipped
+    row has no register number, nobody is removed. The last row wins for a
+    repeated register number. Returns an ImportSummary.
+    """
+    summary = ImportSummary()
+    roster = {}
+    skipped = set()
+    unidentified_skips = 0
+    with transaction.atomic():
+        students = {s.register_number: s for s in Student.objects.filter(institution=institution)}
+        for df in frames:
+            df = normalize_columns(df)
+            rows = clean_student_rows(df)
+            summary.rows_read += len(df)
+            summary.rows_skipped += len(df) - len(rows)
+            skipped_numbers = _text(df[REGISTER_NUMBER_COLUMN].drop(rows.index))
+            skipped.update(skipped_numbers.dropna())
+            unidentified_skips += int(skipped_numbers.isna().sum())
+            for row in rows.itertuples(index=False):
+                roster[row.register_number] = {
+                    'name': row.name,
+                    'student_class': int(row.student_class),
+                    'fathers_name': row.fathers_name,
+                    'division': row.division,
+                }
+            if progress:
+                progress(summary.rows_read)
+
+        new_students = []
+        changed_students = []
+        for reg, values in roster.items():
+            student = students.get(reg)
+            if student is None:
+                new_students.append(Student(institution=institution, register_number=reg, **values))
+            elif any(getattr(student, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(student, field, value)
+                changed_students.append(student)
+            else:
+                summary.students_unchanged += 1
+
+        if new_students:
+            Student.objects.bulk_create(new_students, batch_size=DEFAULT_CHUNK_SIZE)
+        if changed_students:
+            Student.objects.bulk_update(changed_students, STUDENT_FIELDS, batch_size=DEFAULT_CHUNK_SIZE)
+        summary.students_created = len(new_students)
+        summary.students_updated = len(changed_students)
+
+        if remove_missing and roster:
+            classes = {values['student_class'] for values in roster.values()}
+            missing = {
+                reg: s.id for reg, s in students.items()
+                if reg not in roster and s.student_class in classes
+            }
+            # A skipped row may be a listed student with a typo (a class of
+            # "5A", say); removing them would delete all their results. A
+            # skipped row without a register number could be anyone.
+            kept = set(missing) if unidentified_skips else skipped & set(missing)
+            missing = [student_id for reg, student_id in missing.items() if reg not in kept]
+            summary.students_kept = len(kept)
+            if missing:
+                # A queryset delete still sends post_delete, so results and caches
+                # follow; batched so each class is refreshed once, not per student.
+                with batched_results_changes():
+                    Student.objects.filter(id__in=missing).delete()
+            summary.students_deleted = len(missing)
+
+        touched = [s.id for s in changed_students]
+        touched += Student.objects.filter(
+            institution=institution, register_number__in=[s.register_number for s in new_students],
+        ).values_list('id', flat=True)
+        if touched:
+            results_changed.send(sender=Student, student_ids=touched, exam_ids=None)
+    return summary
@@ -0,0 +1,360 @@
+"""
+Background processing of uploaded sheets.
+
+Uploads are stored as ImportJob rows and processed either on a small thread
+pool inside the web process (IMPORT_WORKER = 'thread') or by
+`manage.py run_import_worker`. Jobs are claimed with a conditional UPDATE so
+several workers never run the same job. An import runs in one transaction,
+so live progress is published through the cache rather than the job row;
+use a shared cache (RESULT_CACHE_DIR) when running a separate worker process.
+Uploads are fingerprinted with SHA-256 so resubmitting the same file reuses
+the existing job instead of importing it again. A job left RUNNING for longer
+than IMPORT_JOB_TIMEOUT is taken to have died with its worker and is failed;
+in thread mode, jobs left QUEUED by a restart are picked up again once the
+pool starts. Marks workbooks with several
+sheets (one per class) are parsed in a process pool while this process stays
+the single writer.
+"""
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .importers import import_results, import_students, ResultImporter, ImportFormatError, DEFAULT_CHUNK_SIZE
+from .models import ImportJob
+from .readers import open_sheet, read_sheet, workbook_sheets, SheetReadError
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_TIMEOUT = 60 * 60 * 24
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _progress_key(job_id):
+    return f'import-job-progress:{job_id}'
+
+
+def report_progress(job_id, rows_processed, rows_total, sheets=None):
+    cache.set(_progress_key(job_id), {
+        'rows_processed': rows_processed, 'rows_total': rows_total, 'sheets': sheets,
+    }, PROGRESS_TIMEOUT)
+
+
+def job_status(job):
+    """JSON-friendly status of a job, with live progress and an ETA while it runs."""
+    rows_processed, rows_total = job.rows_processed, job.rows_total
+    sheets = job.summary.get('sheets')
+    if job.status == 'RUNNING':
+        live = cache.get(_progress_key(job.id))
+        if live:
+            rows_processed, rows_total = live['rows_processed'], live['rows_total']
+            sheets = live.get('sheets')
+
+    eta_seconds = None
+    if job.status == 'RUNNING' and job.started_at and rows_processed and rows_total:
+        elapsed = (timezone.now() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed / rows_processed * max(rows_total - rows_processed, 0))
+
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'file': job.original_name,
+        'rows_total': rows_total,
+        'rows_processed': rows_processed,
+        'eta_seconds': eta_seconds,
+        'errors': job.errors,
+        'summary': job.summary,
+        'sheets': sheets or [],
+    }
+
+
+def file_sha256(uploaded_file):
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def _stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+
+
+def fail_stale_jobs():
+    """Fail RUNNING jobs started more than IMPORT_JOB_TIMEOUT ago. Returns how many."""
+    failed = 0
+    for job in ImportJob.objects.filter(status='RUNNING', started_at__lt=_stale_cutoff()):
+        errors = job.errors + ['The import stopped before it finished. Please upload the file again.']
+        # Conditional, like claim_job: a job that finished meanwhile is left alone.
+        if ImportJob.objects.filter(id=job.id, status='RUNNING').update(status='FAILED', errors=errors, finished_at=timezone.now()):
+            cache.delete(_progress_key(job.id))
+            if job.file:
+                job.file.delete(save=True)
+            failed += 1
+    return failed
+
+
+def find_duplicate_job(institution, kind, content_hash, exam=None, remove_missing=False):
+    """
+    The job an identical upload should reuse: one for the same file that is
+    still queued or running (and not stale), or the latest finished import of
+    this kind (for this exam) if it was this same file and succeeded.
+    """
+    jobs = ImportJob.objects.filter(institution=institution, kind=kind, exam=exam, remove_missing=remove_missing)
+    in_flight = (
+        jobs.filter(content_hash=content_hash, status__in=['QUEUED', 'RUNNING'])
+        .exclude(status='RUNNING', started_at__lt=_stale_cutoff())
+        .order_by('-created_at', '-id').first()
+    )
+    if in_flight:
+        return in_flight
+    latest = jobs.filter(status__in=['DONE', 'FAILED']).order_by('-finished_at', '-id').first()
+    if latest and latest.status == 'DONE' and latest.content_hash == content_hash:
+        return latest
+    return None
+
+
+def enqueue_import(institution, kind, uploaded_file, exam=None, remove_missing=False):
+    """
+    Queue an upload. Returns (job, created); an identical file that is already
+    queued, running or was the last import reuses that job without parsing.
+    """
+    content_hash = file_sha256(uploaded_file)
+    while True:
+        # A stale job would still hold the unique_in_flight_import slot.
+        fail_stale_jobs()
+        duplicate = find_duplicate_job(institution, kind, content_hash, exam=exam, remove_missing=remove_missing)
+        if duplicate:
+            return duplicate, False
+        job = ImportJob(
+            institution=institution, kind=kind, exam=exam,
+            file=uploaded_file, original_name=uploaded_file.name, content_hash=content_hash,
+            remove_missing=remove_missing,
+        )
+        try:
+            # The unique_in_flight_import constraint, not the lookup above,
+            # is what stops two concurrent identical uploads both queueing.
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            # Lost the race: the other upload's job is found on the next pass.
+            job.file.delete(save=False)
+            continue
+        if settings.IMPORT_WORKER == 'thread':
+            transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.id))
+        return job, True
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMPORT_WORKER_THREADS, thread_name_prefix='import-worker')
+            # Pick up whatever the previous process left behind.
+            _executor.submit(_resume)
+        return _executor
+
+
+def resume_jobs():
+    """
+    In thread mode, start this process's pool if it is not running yet, which
+    fails stale jobs and runs the ones left queued (by a restart, say).
+    """
+    if settings.IMPORT_WORKER == 'thread':
+        _get_executor()
+
+
+def _resume():
+    fail_stale_jobs()
+    _run_in_thread()
+
+
+def _run_in_thread(job_id=None):
+    """Run the given job if it is still queued, then any others waiting."""
+    try:
+        job = claim_job(job_id) if job_id is not None else None
+        if job is not None:
+            run_job(job)
+        job = claim_job()
+        while job is not None:
+            run_job(job)
+            job = claim_job()
+    finally:
+        connection.close()
+
+
+def claim_job(job_id=None):
+    """Atomically move a queued job (the given one, or the oldest) to RUNNING."""
+    queued = ImportJob.objects.filter(status='QUEUED')
+    if job_id is None:
+        job_id = queued.order_by('created_at', 'id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+    claimed = queued.filter(id=job_id).update(status='RUNNING', started_at=timezone.now())
+    return ImportJob.objects.get(id=job_id) if claimed else None
+
+
+def _parse_sheets(job, names):
+    """
+    Yields (index, frames, error) per sheet as sheets finish parsing; `frames`
+    must be consumed before asking for the next sheet. Sheets are parsed in a
+    process pool when the file is on local disk, at most one sheet per worker
+    ahead of the importer; otherwise they are read lazily, one chunk at a
+    time. The caller stays the only writer.
+    """
+    try:
+        path = job.file.path
+    except NotImplementedError:
+        path = None
+
+    if path is None or settings.IMPORT_SHEET_WORKERS < 2:
+        for index, name in enumerate(names):
+            with job.file.open('rb') as f:
+                try:
+                    reader = open_sheet(f, job.original_name, name)
+                except SheetReadError as e:
+                    yield index, None, str(e)
+                    continue
+                yield index, reader.chunks(DEFAULT_CHUNK_SIZE), None
+                reader.close()
+        return
+
+    workers = min(settings.IMPORT_SHEET_WORKERS, len(names))
+    remaining = iter(enumerate(names))
+    # spawn, not fork: the parent may be a threaded web process.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        def submit(count):
+            for index, name in itertools.islice(remaining, count):
+                pending[pool.submit(read_sheet, path, job.original_name, name, DEFAULT_CHUNK_SIZE)] = index
+
+        pending = {}
+        submit(workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                # Keep the pool busy while this sheet is imported, but never
+                # hold more parsed sheets than there are workers.
+                submit(1)
+                try:
+                    frames, error = future.result(), None
+                except Exception as e:
+                    frames, error = None, str(e)
+                yield index, frames, error
+
+
+def import_workbook(job, sheets):
+    """
+    Import every sheet of a multi-sheet marks workbook in one transaction.
+    A sheet that cannot be opened or lacks the required columns is reported
+    and skipped; the others are still imported.
+    """
+    importer = ResultImporter(job.institution, job.exam, chunk_size=DEFAULT_CHUNK_SIZE)
+    rows_total = sum(rows for _, rows in sheets)
+    status = [{'name': name, 'status': 'QUEUED', 'rows': 0, 'errors': []} for name, _ in sheets]
+
+    def progress():
+        report_progress(job.id, importer.summary.rows_read, rows_total, status)
+
+    with importer.session():
+        for index, frames, error in _parse_sheets(job, [name for name, _ in sheets]):
+            sheet = status[index]
+            if error is None:
+                sheet['status'] = 'RUNNING'
+                try:
+                    for df in frames:
+                        importer.import_frame(df)
+                        sheet['rows'] += len(df)
+                        progress()
+                except ImportFormatError as e:
+                    # Raised by the first chunk, before anything of the sheet
+                    # is written: every chunk has the same columns.
+                    error = str(e)
+            if error:
+                sheet['status'] = 'FAILED'
+                sheet['errors'].append(error)
+                progress()
+                continue
+            sheet['status'] = 'DONE'
+        progress()
+    return importer.summary, status
+
+
+def run_job(job):
+    try:
+        sheets = None
+        if job.kind == 'RESULTS':
+            with job.file.open('rb') as f:
+                sheets = workbook_sheets(f, job.original_name)
+        if sheets and len(sheets) > 1:
+            job.rows_total = sum(rows for _, rows in sheets)
+            job.save(update_fields=['rows_total'])
+            summary, status = import_workbook(job, sheets)
+            failed = [sheet for sheet in status if sheet['status'] == 'FAILED']
+            job.errors = job.errors + [f"Sheet '{sheet['name']}': {error}" for sheet in failed for error in sheet['errors']]
+            job.summary = dict(summary.as_dict(), sheets=status)
+            job.rows_processed = summary.rows_read
+            job.rows_total = summary.rows_read
+            job.status = 'FAILED' if len(failed) == len(status) else 'DONE'
+        else:
+            _run_single_sheet(job)
+    except (ImportFormatError, SheetReadError) as e:
+        job.errors = job.errors + [str(e)]
+        job.status = 'FAILED'
+    except Exception as e:
+        logger.exception("Import job %s failed", job.id)
+        job.errors = job.errors + [f'Error processing file: {e}']
+        job.status = 'FAILED'
+    job.finished_at = timezone.now()
+    job.save()
+    cache.delete(_progress_key(job.id))
+    if job.file:
+        job.file.delete(save=True)
+    return job
+
+
+def _run_single_sheet(job):
+    with job.file.open('rb') as f:
+        reader = open_sheet(f, job.original_name)
+        rows_total = reader.estimated_rows
+        job.rows_total = rows_total
+        job.save(update_fields=['rows_total'])
+
+        def progress(rows_processed):
+            report_progress(job.id, rows_processed, rows_total)
+
+        frames = reader.chunks(DEFAULT_CHUNK_SIZE)
+        if job.kind == 'RESULTS':
+            summary = import_results(job.institution, job.exam, frames, progress=progress)
+        else:
+            summary = import_students(job.institution, frames, progress=progress, remove_missing=job.remove_missing)
+    job.summary = summary.as_dict()
+    job.rows_processed = summary.rows_read
+    job.rows_total = summary.rows_read
+    job.status = 'DONE'
+
+
+def run_worker(poll_interval=2.0, once=False):
+    """Process queued jobs forever (or until the queue is empty with once=True)."""
+    while True:
+        job = claim_job()
+        if job is None:
+            fail_stale_jobs()
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
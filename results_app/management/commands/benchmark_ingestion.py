@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+FIXED_COLUMNS = ['Register Number', 'Name', "Father's Name", 'Class', 'Division']
+SUBJECTS = ['Malayalam', 'English', 'Arabic', 'Maths', 'Science', 'Social', 'Hindi', 'Urdu']
+DEFAULT_SIZES = [10_000, 100_000, 500_000]
+
+
+def write_sheet(path, cells):
+    from openpyxl import Workbook
+
+    header = FIXED_COLUMNS + SUBJECTS
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for i in range(max(cells // len(header), 1)):
+        sheet.append([1000 + i, f'Student {i}', f'Father {i}', 5 + i % 5, 'ABC'[i % 3]]
+                     + [(i * 7 + j * 13) % 101 for j in range(len(SUBJECTS))])
+    workbook.save(path)
+
+
+def _peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _read_pandas(path):
+    import pandas as pd
+
+    df = pd.read_excel(path).astype(str)
+    return len(df)
+
+
+def _read_streaming(path):
+    from results_app.readers import open_sheet
+
+    with open(path, 'rb') as f:
+        return sum(len(chunk) for chunk in open_sheet(f, path).chunks())
+
+
+def _measure(reader, path, queue):
+    import pandas  # noqa: F401 - both paths build DataFrames; keep it out of the measured delta
+    import openpyxl  # noqa: F401
+
+    baseline = _peak_rss_kb()
+    start = time.perf_counter()
+    rows = reader(path)
+    queue.put((rows, time.perf_counter() - start, _peak_rss_kb() - baseline))
+
+
+class Command(BaseCommand):
+    help = "Compare wall time and peak memory of the pandas and streaming Excel readers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cells', type=int, nargs='+', default=DEFAULT_SIZES,
+                            help='Sheet sizes to test, in cells.')
+
+    def handle(self, *args, **options):
+        # Each measurement runs in a fresh process so peak RSS is not shared.
+        ctx = multiprocessing.get_context('spawn')
+        self.stdout.write(f"{'cells':>9} {'reader':<10} {'rows':>7} {'seconds':>8} {'peak MB':>8}")
+        for cells in options['cells']:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'marks.xlsx')
+                write_sheet(path, cells)
+                for label, reader in (('pandas', _read_pandas), ('streaming', _read_streaming)):
+                    queue = ctx.Queue()
+                    process = ctx.Process(target=_measure, args=(reader, path, queue))
+                    process.start()
+                    rows, seconds, peak_kb = queue.get()
+                    process.join()
+                    self.stdout.write(f"{cells:>9} {label:<10} {rows:>7} {seconds:>8.2f} {peak_kb / 1024:>8.1f}")
@@ -0,0 +1,58 @@
+import time
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from results_app.importers import import_results
+from results_app.models import Institution, Exam
+
+SUBJECTS = ['Malayalam', 'English', 'Arabic', 'Maths', 'Science', 'Social', 'Hindi', 'Urdu']
+
+
+def marks_sheet(rows, changed=0):
+    data = {
+        'Register Number': [f'B{i:06d}' for i in range(rows)],
+        'Name': [f'Student {i}' for i in range(rows)],
+        'Class': [5 + i % 5 for i in range(rows)],
+    }
+    for j, subject in enumerate(SUBJECTS):
+        data[subject] = [(i * 7 + j * 13) % 101 for i in range(rows)]
+    df = pd.DataFrame(data)
+    # Correct the first subject for the first `changed` students.
+    df.loc[:changed - 1, SUBJECTS[0]] = (df.loc[:changed - 1, SUBJECTS[0]] + 1) % 101
+    return df
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a first upload, an identical re-upload and a re-upload with a few corrections "
+        "for a generated marks sheet. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--changed', type=int, default=20, help='Marks corrected in the last run.')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        runs = [
+            ('first upload', marks_sheet(rows)),
+            ('identical re-upload', marks_sheet(rows)),
+            (f"{options['changed']} corrections", marks_sheet(rows, changed=options['changed'])),
+        ]
+        self.stdout.write(f"{'run':<22} {'seconds':>8} {'queries':>8} {'written':>8} {'unchanged':>10}")
+        with transaction.atomic():
+            user = User.objects.create(username='benchmark-reupload')
+            institution = Institution.objects.create(user=user, name='Benchmark', is_approved=True)
+            exam = Exam.objects.create(institution=institution, name='Benchmark')
+            for label, df in runs:
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    summary = import_results(institution, exam, [df])
+                seconds = time.perf_counter() - start
+                written = summary.marks_inserted + summary.marks_updated
+                self.stdout.write(f"{label:<22} {seconds:>8.2f} {len(queries):>8} {written:>8} {summary.marks_unchanged:>10}")
+            transaction.set_rollback(True)
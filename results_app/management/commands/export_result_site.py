@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+
+from results_app.models import Institution, Exam
+from results_app.output_index import content_hash, load_index, needs_render, save_index
+from results_app.rank_index import add_class_ranks
+from results_app.site_pages import init_worker, render_pages
+from results_app.snapshots import current_snapshots
+
+
+def _page_exams(institution, payload, exam_id):
+    """The exam's entry of a snapshot payload, ranked as on the live page; [] if the student has no results in it."""
+    exams = [exam for exam in payload['exams'] if exam.get('exam_id') == exam_id]
+    return add_class_ranks(institution, {**payload, 'exams': exams}) if exams else []
+
+
+def _page_hash(institution, student, exams):
+    return content_hash({
+        'institution': [institution.name, institution.grading_system, institution.grading_key],
+        'student': student,
+        'exams': exams,
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the public result page of every student with results in one exam "
+        "into static HTML (with .gz siblings) plus a JSON index keyed by register number. "
+        "Only pages whose data changed since the last export are re-rendered, and pages "
+        "of students no longer exported are removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institution', type=int, required=True, help='Institution id.')
+        parser.add_argument('--exam', type=int, required=True, help='Exam id.')
+        parser.add_argument('--output', required=True, help='Root directory of the static site.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Rendering processes (default: CPU count).')
+        parser.add_argument('--force', action='store_true', help='Re-render every page, even unchanged ones.')
+
+    def handle(self, *args, **options):
+        try:
+            institution = Institution.objects.get(id=options['institution'])
+            exam = Exam.objects.get(id=options['exam'], institution=institution)
+        except (Institution.DoesNotExist, Exam.DoesNotExist):
+            raise CommandError('Unknown institution or exam.')
+
+        out_dir = os.path.join(options['output'], str(institution.id), str(exam.id))
+        os.makedirs(out_dir, exist_ok=True)
+        index = load_index(out_dir)
+
+        pending = []
+        new_index = {}
+        for snapshot in current_snapshots(institution):
+            exams = _page_exams(institution, snapshot.payload, exam.id)
+            if not exams:
+                continue
+            register_number = snapshot.register_number
+            student = snapshot.payload['student']
+            filename = f'{quote(register_number, safe="")}.html'
+            new_index[register_number] = {'path': filename, 'hash': _page_hash(institution, student, exams)}
+            if needs_render(out_dir, index.get(register_number), new_index[register_number], options['force']):
+                pending.append((student, exams, filename))
+
+        # What the template reads of the institution, as plain data for the workers.
+        page_institution = {'id': institution.id, 'name': institution.name, 'grading_system': institution.grading_system}
+        workers = options['workers'] or 1
+        if len(pending) > 1 and workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            ) as pool:
+                size = max(1, len(pending) // (workers * 4))
+                futures = [
+                    pool.submit(render_pages, page_institution, out_dir, pending[i:i + size])
+                    for i in range(0, len(pending), size)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            render_pages(page_institution, out_dir, pending)
+
+        # Sweep the directory rather than the old index, so stale pages go
+        # even when the index was lost or ignored.
+        exported = {entry['path'] for entry in new_index.values()}
+        removed = 0
+        for name in os.listdir(out_dir):
+            page = name[:-len('.gz')] if name.endswith('.gz') else name
+            if page.endswith('.html') and page not in exported:
+                os.remove(os.path.join(out_dir, name))
+                if name == page:
+                    removed += 1
+
+        save_index(out_dir, new_index)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {exam.name} for {institution.name}: {len(pending)} rendered, "
+            f"{len(new_index) - len(pending)} unchanged, {removed} removed."
+        ))
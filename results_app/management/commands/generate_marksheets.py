@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from results_app.marksheets import generate_marksheets, stream_zip
+from results_app.models import Institution
+
+
+class Command(BaseCommand):
+    help = (
+        "Render printable PDF marksheets for every student of an institution (or one class) "
+        "in a process pool. Only students whose results changed since the last run are re-rendered."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institution', type=int, required=True, help='Institution id.')
+        parser.add_argument('--class', dest='student_class', type=int, help='Only this class.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Rendering processes (default: CPU count).')
+        parser.add_argument('--force', action='store_true', help='Re-render every marksheet, even unchanged ones.')
+        parser.add_argument('--zip', help='Also bundle the marksheets into this ZIP file.')
+
+    def handle(self, *args, **options):
+        try:
+            institution = Institution.objects.get(id=options['institution'])
+        except Institution.DoesNotExist:
+            raise CommandError(f"Institution {options['institution']} does not exist.")
+
+        files, rendered, unchanged, removed = generate_marksheets(
+            institution, student_class=options['student_class'], workers=options['workers'], force=options['force'],
+        )
+        if options['zip']:
+            with open(options['zip'], 'wb') as f:
+                for chunk in stream_zip((os.path.basename(path), path) for _, path in files):
+                    f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f"Marksheets for {institution.name}: {rendered} rendered, {unchanged} unchanged, {removed} removed."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from results_app.models import Institution
+from results_app.snapshots import publish_institution
+
+
+class Command(BaseCommand):
+    help = "Publish (rebuild) the public result snapshots of one or all approved institutions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institution', type=int, help='Institution id. Defaults to every approved institution.')
+
+    def handle(self, *args, **options):
+        institutions = Institution.objects.filter(is_approved=True)
+        if options['institution']:
+            institutions = Institution.objects.filter(id=options['institution'])
+            if not institutions.exists():
+                raise CommandError(f"Institution {options['institution']} does not exist.")
+
+        for institution in institutions:
+            count = publish_institution(institution)
+            self.stdout.write(self.style.SUCCESS(f"Published {count} result(s) for {institution.name}"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from results_app.models import Institution, Exam
+from results_app.summaries import rebuild_exam_summaries
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair the student and class exam summary tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institution', type=int, help='Only rebuild this institution.')
+        parser.add_argument('--exam', type=int, help='Only rebuild this exam.')
+
+    def handle(self, *args, **options):
+        exams = Exam.objects.select_related('institution').order_by('institution_id', 'name')
+        if options['institution']:
+            if not Institution.objects.filter(id=options['institution']).exists():
+                raise CommandError(f"Institution {options['institution']} does not exist.")
+            exams = exams.filter(institution_id=options['institution'])
+        if options['exam']:
+            exams = exams.filter(id=options['exam'])
+
+        for exam in exams:
+            rebuild_exam_summaries(exam)
+            self.stdout.write(f"Rebuilt summaries for {exam.institution.name}: {exam.name}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from results_app.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Process queued bulk uploads (use with IMPORT_WORKER=process)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Import worker started.")
+        run_worker(poll_interval=options['poll_interval'], once=options['once'])
@@ -0,0 +1,279 @@
+"""
+Saving edited marks in one batch.
+
+The mark entry screens post many cells at once. parse_marks turns the posted
+values into floats (None for cleared cells), and save_marks diffs them against
+the marks already loaded for the page. It writes only what changed: one bulk
+upsert and one delete, in one transaction, with one results_changed
+notification for the whole batch.
+
+The whole-class grid loads a class's marks for one exam as a
+ClassMarksMatrix, in a constant number of queries whatever the class size.
+The grid and the single-subject list post the version each cell was loaded
+at, and save_versioned_marks writes them with the same version checks as the
+autosave API below.
+
+apply_cell_changes backs the autosave API: small batches of individual cells,
+each carrying the Result.version it was edited against. Each cell is written
+with a conditional UPDATE/DELETE on that version (or an INSERT guarded by the
+unique constraint), so cells whose row has moved on since are rejected as
+conflicts instead of overwriting someone else's edit, without relying on row
+locks the database may not have.
+"""
+import math
+
+from django.db import IntegrityError, transaction
+
+from .importers import MAX_SUBJECT_MARKS
+from .matrix import ClassMarksMatrix
+from .models import Student, Subject, Exam, Result
+from .signals import batched_results_changes
+
+MAX_CELL_CHANGES = 500
+
+
+def parse_mark(value):
+    """
+    A posted mark as a float, None for an empty cell; raises ValueError unless
+    it is a finite number between 0 and MAX_SUBJECT_MARKS.
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    mark = float(value)
+    if not math.isfinite(mark) or not 0 <= mark <= MAX_SUBJECT_MARKS:
+        raise ValueError(f'Marks must be between 0 and {MAX_SUBJECT_MARKS}.')
+    return mark
+
+
+def save_marks(exam, marks, existing):
+    """
+    Apply `marks`, {(student_id, subject_id): float or None}, for `exam`.
+    `existing` maps the same keys to the current Result rows. Unchanged cells
+    are skipped. Returns (saved, deleted) counts.
+    """
+    upserts = []
+    delete_ids = []
+    for (student_id, subject_id), value in marks.items():
+        current = existing.get((student_id, subject_id))
+        if value is None:
+            if current is not None:
+                delete_ids.append(current.id)
+        elif current is None or current.marks != value:
+            upserts.append(_result(student_id, subject_id, exam.id, value, current))
+    if upserts or delete_ids:
+        with transaction.atomic():
+            _write(upserts, delete_ids)
+    return len(upserts), len(delete_ids)
+
+
+def save_versioned_marks(exam, marks, existing):
+    """
+    Apply `marks`, {(student_id, subject_id): (float or None, version)}, for
+    `exam`, where version is the Result.version the page showed (0 for an
+    empty cell). `existing` maps the same keys to the current Result rows.
+    Unchanged cells are skipped; each other cell is written only if it is
+    still at its version, so cells someone else saved since are left alone.
+    Returns (saved, deleted, conflicts), conflicts being the skipped keys.
+    """
+    saved = deleted = 0
+    conflicts = []
+    with transaction.atomic(), batched_results_changes() as batch:
+        for (student_id, subject_id), (value, expected) in marks.items():
+            current = existing.get((student_id, subject_id))
+            version = current.version if current is not None else 0
+            if version == expected and (current.marks if current is not None else None) == value:
+                continue
+            if version != expected or _write_cell((student_id, subject_id, exam.id), value, expected, batch) is None:
+                conflicts.append((student_id, subject_id))
+            elif value is None:
+                deleted += 1
+            else:
+                saved += 1
+    return saved, deleted, conflicts
+
+
+def _result(student_id, subject_id, exam_id, marks, current):
+    version = current.version + 1 if current is not None else 1
+    return Result(student_id=student_id, subject_id=subject_id, exam_id=exam_id, marks=marks, version=version)
+
+
+def _write(upserts, delete_ids):
+    """One bulk upsert and one delete, with a single results_changed for both."""
+    with batched_results_changes() as batch:
+        if upserts:
+            Result.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['student', 'subject', 'exam'],
+                update_fields=['marks', 'version'],
+            )
+            batch.add({r.student_id for r in upserts}, {r.exam_id for r in upserts})
+        if delete_ids:
+            Result.objects.filter(id__in=delete_ids).delete()
+
+
+class CellChangeError(ValueError):
+    pass
+
+
+def _parse_change(change):
+    try:
+        key = (int(change['student_id']), int(change['subject_id']), int(change['exam_id']))
+        marks = change.get('marks')
+        marks = parse_mark(str(marks)) if marks is not None else None
+        expected = change.get('expected_version')
+        expected = int(expected) if expected is not None else None
+    except (KeyError, TypeError, ValueError):
+        raise CellChangeError(f'Each change needs integer student_id, subject_id and exam_id, marks between 0 and {MAX_SUBJECT_MARKS} or null, and an integer or null expected_version.')
+    return key, marks, expected
+
+
+def apply_cell_changes(institution, changes):
+    """
+    Apply a batch of autosaved cells. Each change is a dict with student_id,
+    subject_id, exam_id, marks (None clears the cell) and expected_version,
+    the version the client last saw (None or 0 for a cell with no mark yet).
+
+    Returns {'saved': [...], 'conflicts': [...], 'errors': [...]}: saved cells
+    with their new version (0 once cleared), conflicts with the current marks
+    and version so the client can show them, and changes that were rejected as
+    invalid. Conflicting and invalid cells are skipped; the rest are written.
+    """
+    if not isinstance(changes, list):
+        raise CellChangeError('Expected a list of changes.')
+    if len(changes) > MAX_CELL_CHANGES:
+        raise CellChangeError(f'At most {MAX_CELL_CHANGES} changes can be saved at once.')
+
+    parsed = {}
+    errors = []
+    for index, change in enumerate(changes):
+        try:
+            key, marks, expected = _parse_change(change if isinstance(change, dict) else {})
+        except CellChangeError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        # The last change to a cell wins, as it would have in the form.
+        parsed[key] = (marks, expected or 0)
+
+    student_ids = {key[0] for key in parsed}
+    subject_ids = {key[1] for key in parsed}
+    exam_ids = {key[2] for key in parsed}
+    student_classes = dict(Student.objects.filter(institution=institution, id__in=student_ids).values_list('id', 'student_class'))
+    subject_classes = dict(Subject.objects.filter(institution=institution, id__in=subject_ids).values_list('id', 'student_class'))
+    valid_exams = set(Exam.objects.filter(institution=institution, id__in=exam_ids).values_list('id', flat=True))
+    for key in list(parsed):
+        student_id, subject_id, exam_id = key
+        student_class = student_classes.get(student_id)
+        if student_class is None or exam_id not in valid_exams or subject_classes.get(subject_id) != student_class:
+            errors.append(_cell(key, error='Unknown student, subject or exam, or the subject is not taught in the student\'s class.'))
+            del parsed[key]
+
+    saved, conflicts = [], []
+    with transaction.atomic(), batched_results_changes() as batch:
+        current = {
+            (r.student_id, r.subject_id, r.exam_id): r
+            for r in Result.objects.filter(
+                student_id__in=student_ids, subject_id__in=subject_ids, exam_id__in=exam_ids,
+            ).only('id', 'student_id', 'subject_id', 'exam_id', 'marks', 'version')
+            if (r.student_id, r.subject_id, r.exam_id) in parsed
+        }
+        for key, (marks, expected) in parsed.items():
+            row = current.get(key)
+            version = row.version if row is not None else 0
+            if version == expected and (row.marks if row is not None else None) == marks:
+                saved.append(_cell(key, marks=marks, version=version))
+                continue
+            # The version read above may already be stale; the write itself
+            # checks it again.
+            version = _write_cell(key, marks, expected, batch) if version == expected else None
+            if version is None:
+                row = Result.objects.filter(student_id=key[0], subject_id=key[1], exam_id=key[2]).only('marks', 'version').first()
+                conflicts.append(_cell(key, marks=row.marks if row is not None else None, version=row.version if row is not None else 0))
+            else:
+                saved.append(_cell(key, marks=marks, version=version))
+    return {'saved': saved, 'conflicts': conflicts, 'errors': errors}
+
+
+def _write_cell(key, marks, expected, batch):
+    """
+    Write one cell if it is still at version `expected` (0: no mark yet).
+    Returns the cell's new version, or None if another edit got there first.
+    """
+    student_id, subject_id, exam_id = key
+    cell = Result.objects.filter(student_id=student_id, subject_id=subject_id, exam_id=exam_id)
+    if expected == 0:
+        try:
+            with transaction.atomic():
+                Result.objects.create(student_id=student_id, subject_id=subject_id, exam_id=exam_id, marks=marks)
+        except IntegrityError:
+            return None
+        return 1
+    if marks is None:
+        deleted, _ = cell.filter(version=expected).delete()
+        return 0 if deleted else None
+    if not cell.filter(version=expected).update(marks=marks, version=expected + 1):
+        return None
+    batch.add([student_id], [exam_id])
+    return expected + 1
+
+
+def _cell(key, **values):
+    student_id, subject_id, exam_id = key
+    return {'student_id': student_id, 'subject_id': subject_id, 'exam_id': exam_id, **values}
+
+
+class MarksGrid:
+    """A class's student x subject marks for one exam, with the Result rows behind them."""
+
+    def __init__(self, institution, class_num, exam, subjects):
+        students = list(Student.objects.filter(institution=institution, student_class=class_num).order_by('name'))
+        results = Result.objects.filter(
+            exam=exam, student__institution=institution, student__student_class=class_num,
+        ).only('id', 'student_id', 'subject_id', 'marks', 'version')
+        self.existing = {(r.student_id, r.subject_id): r for r in results}
+        self.matrix = ClassMarksMatrix(
+            institution, class_num, exam, students, subjects,
+            [(student_id, subject_id, r.marks) for (student_id, subject_id), r in self.existing.items()],
+        )
+
+    def rows(self):
+        """[{'student', 'cells': [(subject_id, mark or '', version)]}] for the grid template."""
+        subjects = self.matrix.subjects
+        rows = []
+        for i, student in enumerate(self.matrix.students):
+            cells = []
+            for j, subject in enumerate(subjects):
+                mark = self.matrix.mark(i, j)
+                result = self.existing.get((student.id, subject.id))
+                cells.append((subject.id, '' if mark is None else mark, result.version if result else 0))
+            rows.append({'student': student, 'cells': cells})
+        return rows
+
+    def parse(self, data):
+        """
+        Posted grid cells as {(student_id, subject_id): (mark, version)}, plus
+        the (student, subject) pairs whose value was not a number or came
+        without the version it was edited against. Cells missing from `data`
+        are left as they are, so the page only needs to post the cells that
+        changed.
+        """
+        marks = {}
+        invalid = []
+        for student in self.matrix.students:
+            for subject in self.matrix.subjects:
+                value = data.get(f'mark_{student.id}_{subject.id}')
+                if value is None:
+                    continue
+                try:
+                    marks[(student.id, subject.id)] = (parse_mark(value), int(data.get(f'version_{student.id}_{subject.id}', '')))
+                except ValueError:
+                    invalid.append((student, subject))
+        return marks, invalid
+
+    def save(self, marks):
+        """Save parsed cells; returns (saved, deleted, [(student, subject)] in conflict)."""
+        saved, deleted, conflicts = save_versioned_marks(self.matrix.exam, marks, self.existing)
+        students = {student.id: student for student in self.matrix.students}
+        subjects = {subject.id: subject for subject in self.matrix.subjects}
+        return saved, deleted, [(students[student_id], subjects[subject_id]) for student_id, subject_id in conflicts]
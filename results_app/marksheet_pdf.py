@@ -0,0 +1,89 @@
+"""
+Marksheet rendering for pool workers.
+
+This module must not import Django (directly or through the app's other
+modules): marksheets.py renders in spawned processes, which unpickle the
+worker function by importing its module before anything has set Django up.
+"""
+from .output_index import write_atomic
+from .pdf import PdfDocument, PAGE_WIDTH, PAGE_HEIGHT, text_width
+
+MARGIN = 50
+ROW_HEIGHT = 18
+
+
+def _clean_mark(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def render_marksheet(institution_name, grading_system, payload):
+    """PDF bytes of one student's marksheet, covering every exam in `payload`."""
+    doc = PdfDocument()
+    student = payload['student']
+    right = PAGE_WIDTH - MARGIN
+
+    def header():
+        doc.text((PAGE_WIDTH - text_width(institution_name, 16)) / 2, PAGE_HEIGHT - MARGIN, institution_name, size=16, bold=True)
+        doc.text((PAGE_WIDTH - text_width('MARKSHEET', 12)) / 2, PAGE_HEIGHT - MARGIN - 20, 'MARKSHEET', size=12, bold=True)
+        doc.line(MARGIN, PAGE_HEIGHT - MARGIN - 30, right, PAGE_HEIGHT - MARGIN - 30, width=1)
+        return PAGE_HEIGHT - MARGIN - 55
+
+    y = header()
+    details = [('Name', student['name']), ("Father's Name", student['fathers_name']),
+               ('Register Number', student['register_number']), ('Class', student['student_class']),
+               ('Division', student['division'])]
+    for label, value in details:
+        if value in (None, ''):
+            continue
+        doc.text(MARGIN, y, f'{label}:', bold=True)
+        doc.text(MARGIN + 110, y, str(value).upper())
+        y -= 16
+    y -= 10
+
+    if not payload['exams']:
+        doc.text(MARGIN, y, 'No results found for this student.')
+
+    show_grades = grading_system not in ('PERCENTAGE', 'PASS_FAIL')
+    for exam in payload['exams']:
+        rows = len(exam.get('marks', ())) + 3
+        if y - rows * ROW_HEIGHT < MARGIN:
+            doc.new_page()
+            y = header()
+        doc.text(MARGIN, y, exam['name'].upper(), size=12, bold=True)
+        y -= 22
+
+        if grading_system == 'PASS_FAIL':
+            doc.text(MARGIN, y, 'Result:', bold=True)
+            doc.text(MARGIN + 110, y, 'PASSED' if exam['is_passed'] else 'FAILED', bold=True)
+            y -= 30
+            continue
+
+        doc.box(MARGIN, y - 5, right - MARGIN, ROW_HEIGHT)
+        doc.text(MARGIN + 5, y, 'Subject', bold=True)
+        doc.text(MARGIN + 300, y, 'Marks', bold=True)
+        if show_grades:
+            doc.text(MARGIN + 400, y, 'Grade', bold=True)
+        y -= ROW_HEIGHT
+        for mark in exam['marks']:
+            doc.text(MARGIN + 5, y, mark['subject'])
+            doc.text(MARGIN + 300, y, _clean_mark(mark['marks']))
+            if show_grades:
+                doc.text(MARGIN + 400, y, mark['grade'])
+            doc.line(MARGIN, y - 5, right, y - 5, width=0.25)
+            y -= ROW_HEIGHT
+        doc.text(MARGIN + 5, y, 'Total', bold=True)
+        doc.text(MARGIN + 300, y, f"{_clean_mark(exam['total'])} / {exam['max_total']}", bold=True)
+        if grading_system == 'SUNNI_BOARD':
+            doc.text(MARGIN + 400, y, 'FAILED' if exam['has_failed_subject'] else exam['total_grade_name'], bold=True)
+        doc.line(MARGIN, y - 5, right, y - 5, width=1)
+        y -= 35
+
+    doc.new_page()
+    return doc.tobytes()
+
+
+def render_batch(institution_name, grading_system, batch):
+    for payload, path in batch:
+        write_atomic(path, render_marksheet(institution_name, grading_system, payload))
+    return len(batch)
@@ -0,0 +1,117 @@
+"""
+Batch printable marksheets.
+
+Each student's marksheet is rendered from their published ResultSnapshot
+(the data student_result_view shows) into a PDF with the pure-Python writer
+in pdf.py. Generation fans out over a process pool and is incremental: a
+per-institution index.json keeps a hash of what each PDF was rendered from,
+and only students whose data changed are rendered again. Downloads are
+bundled into a ZIP that is streamed as it is built.
+"""
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+
+from .marksheet_pdf import render_batch
+from .output_index import content_hash, load_index, needs_render, save_index
+from .snapshots import current_snapshots
+
+
+def marksheet_hash(institution, payload):
+    return content_hash({
+        'institution': [institution.name, institution.grading_system, institution.grading_key],
+        'payload': payload,
+    })
+
+
+def marksheet_dir(institution):
+    return os.path.join(settings.MARKSHEET_ROOT, str(institution.id))
+
+
+def generate_marksheets(institution, student_class=None, workers=None, force=False):
+    """
+    Bring the PDFs of an institution (or one class) up to date. Returns
+    ([(register_number, path)], rendered, unchanged, removed).
+    """
+    out_dir = marksheet_dir(institution)
+    os.makedirs(out_dir, exist_ok=True)
+    index = load_index(out_dir)
+
+    entries = {}
+    pending = []
+    for snapshot in current_snapshots(institution, student_class=student_class):
+        register_number = snapshot.register_number
+        entry = {
+            'path': f'{quote(register_number, safe="")}.pdf',
+            'hash': marksheet_hash(institution, snapshot.payload),
+            'student_class': snapshot.payload['student']['student_class'],
+        }
+        if needs_render(out_dir, index.get(register_number), entry, force):
+            pending.append((snapshot.payload, os.path.join(out_dir, entry['path'])))
+        entries[register_number] = entry
+
+    workers = workers or settings.MARKSHEET_WORKERS
+    if len(pending) > 1 and workers > 1:
+        # spawn, not fork: this may run inside a threaded web process.
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(pending)),
+            mp_context=multiprocessing.get_context('spawn'),
+        ) as pool:
+            # A few batches per worker keeps pickling overhead low and the load even.
+            size = max(1, len(pending) // (workers * 4))
+            futures = [
+                pool.submit(render_batch, institution.name, institution.grading_system, pending[i:i + size])
+                for i in range(0, len(pending), size)
+            ]
+            for future in futures:
+                future.result()
+    else:
+        render_batch(institution.name, institution.grading_system, pending)
+
+    removed = 0
+    for register_number, entry in list(index.items()):
+        in_scope = student_class is None or entry.get('student_class') == student_class
+        if in_scope and register_number not in entries:
+            path = os.path.join(out_dir, entry['path'])
+            if os.path.exists(path):
+                os.remove(path)
+            del index[register_number]
+            removed += 1
+    index.update(entries)
+    save_index(out_dir, index)
+
+    files = [(register_number, os.path.join(out_dir, entry['path'])) for register_number, entry in sorted(entries.items())]
+    return files, len(pending), len(entries) - len(pending), removed
+
+
+class _ZipSink:
+    """Write-only file object collecting what ZipFile writes, for streaming."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files):
+    """Yield a ZIP archive of [(name, path)] piece by piece, one file at a time."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, path in files:
+            archive.write(path, name)
+            yield sink.pop()
+    yield sink.pop()
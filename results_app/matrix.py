@@ -0,0 +1,83 @@
+"""
+Class marks matrix: every mark of one (institution, class, exam) fetched in a
+single query and pivoted into a student x subject grid held in compact
+arrays, with totals and SUNNI_BOARD fail flags computed in the same pass.
+"""
+import math
+from array import array
+
+from .models import Student, Subject, Result
+
+# SUNNI_BOARD fails a student who scores below this in any subject.
+SUNNI_BOARD_PASS_MARK = 40
+
+
+class ClassMarksMatrix:
+    def __init__(self, institution, class_num, exam, students, subjects, results):
+        self.institution = institution
+        self.class_num = class_num
+        self.exam = exam
+        self.students = students
+        self.subjects = subjects
+        self.max_total = len(subjects) * 100
+
+        n, m = len(students), len(subjects)
+        student_index = {s.id: i for i, s in enumerate(students)}
+        subject_index = {s.id: j for j, s in enumerate(subjects)}
+        # marks[i * m + j] is student i's mark in subject j, NaN when not entered.
+        self.marks = array('d', [math.nan]) * (n * m)
+        self.totals = array('d', [0.0]) * n
+        self.entered = array('i', [0]) * n
+        self.failed = bytearray(n)
+
+        check_fail = institution.grading_system == 'SUNNI_BOARD'
+        for student_id, subject_id, mark in results:
+            i = student_index.get(student_id)
+            if i is None:
+                continue
+            # Totals cover every mark of the exam, as the Sum() annotation did,
+            # even for subjects that are no longer columns of the class.
+            self.totals[i] += mark
+            self.entered[i] += 1
+            if check_fail and mark < SUNNI_BOARD_PASS_MARK:
+                self.failed[i] = 1
+            j = subject_index.get(subject_id)
+            if j is not None:
+                self.marks[i * m + j] = mark
+
+    def mark(self, i, j):
+        value = self.marks[i * len(self.subjects) + j]
+        return None if math.isnan(value) else value
+
+    def rows(self):
+        """Table rows as class_result.html expects them, '-' for missing marks."""
+        m = len(self.subjects)
+        data = []
+        for i, student in enumerate(self.students):
+            marks_list = [
+                "-" if math.isnan(value) else value
+                for value in self.marks[i * m:(i + 1) * m]
+            ]
+            data.append({
+                'student': student,
+                'marks': marks_list,
+                'total': self.totals[i],
+                'max_total': self.max_total,
+                'has_failed_subject': bool(self.failed[i]),
+            })
+        return data
+
+
+def build_class_matrix(institution, class_num, exam, students=None, subjects=None):
+    """
+    Build the ClassMarksMatrix for a class and exam in three queries
+    (students, subjects, marks), or one when students and subjects are given.
+    """
+    if students is None:
+        students = Student.objects.filter(institution=institution, student_class=class_num)
+    if subjects is None:
+        subjects = Subject.objects.filter(institution=institution, student_class=class_num)
+    results = Result.objects.filter(
+        exam=exam, student__institution=institution, student__student_class=class_num,
+    ).values_list('student_id', 'subject_id', 'marks')
+    return ClassMarksMatrix(institution, class_num, exam, list(students), list(subjects), results)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0011_alter_institution_grading_system_passfailresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('register_number', models.CharField(max_length=50)),
+                ('payload', models.JSONField(default=dict)),
+                ('published_at', models.DateTimeField(auto_now=True)),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_snapshots', to='results_app.institution')),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result_snapshot', to='results_app.student')),
+            ],
+            options={
+                'unique_together': {('institution', 'register_number')},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0012_resultsnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='institution',
+            name='grading_system',
+            field=models.CharField(choices=[('10_POINT', '10-Point Scale (CBSE Style)'), ('9_POINT', '9-Point Scale (State Board Style)'), ('SUNNI_BOARD', 'Sunni Vidyabhyasa Board'), ('PERCENTAGE', 'Standard Percentage Only'), ('PASS_FAIL', 'Pass / Fail Only'), ('CUSTOM', 'Custom Grading Scheme')], default='PERCENTAGE', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='GradingScheme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grading_schemes', to='results_app.institution')),
+            ],
+            options={
+                'unique_together': {('institution', 'name')},
+            },
+        ),
+        migrations.AddField(
+            model_name='institution',
+            name='grading_scheme',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='results_app.gradingscheme'),
+        ),
+        migrations.CreateModel(
+            name='GradingBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('SUBJECT', 'Subject Marks'), ('TOTAL', 'Total Marks')], default='SUBJECT', max_length=10)),
+                ('min_percentage', models.FloatField()),
+                ('grade', models.CharField(max_length=20)),
+                ('grade_name', models.CharField(blank=True, max_length=100)),
+                ('scheme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='results_app.gradingscheme')),
+            ],
+            options={
+                'ordering': ['scope', '-min_percentage'],
+                'unique_together': {('scheme', 'scope', 'min_percentage')},
+            },
+        ),
+    ]
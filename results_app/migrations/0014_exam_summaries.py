@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0013_grading_scheme'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassExamSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_class', models.IntegerField()),
+                ('student_count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('pass_count', models.PositiveIntegerField(default=0)),
+                ('topper_total', models.FloatField(blank=True, null=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_summaries', to='results_app.exam')),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_summaries', to='results_app.institution')),
+            ],
+            options={
+                'unique_together': {('institution', 'student_class', 'exam')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentExamSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_class', models.IntegerField()),
+                ('total', models.FloatField(default=0)),
+                ('max_total', models.FloatField(default=0)),
+                ('subjects_entered', models.PositiveIntegerField(default=0)),
+                ('has_failed_subject', models.BooleanField(default=False)),
+                ('is_passed', models.BooleanField(default=False)),
+                ('rank', models.PositiveIntegerField(blank=True, null=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_summaries', to='results_app.exam')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_summaries', to='results_app.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['exam', 'student_class', 'rank'], name='results_app_exam_id_59175f_idx')],
+                'unique_together': {('student', 'exam')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0014_exam_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentexamsummary',
+            name='dense_rank',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentexamsummary',
+            name='division_rank',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
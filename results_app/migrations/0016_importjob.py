@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0015_summary_dense_and_division_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('RESULTS', 'Marks Upload'), ('STUDENTS', 'Student Upload')], max_length=10)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Completed'), ('FAILED', 'Failed')], db_index=True, default='QUEUED', max_length=10)),
+                ('file', models.FileField(blank=True, upload_to='imports/%Y/%m/')),
+                ('original_name', models.CharField(max_length=255)),
+                ('rows_total', models.PositiveIntegerField(default=0)),
+                ('rows_processed', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('exam', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='results_app.exam')),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='results_app.institution')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0017_importjob_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='remove_missing',
+            field=models.BooleanField(default=False, help_text='Student uploads: delete students of the listed classes who are not in the file.'),
+        ),
+    ]
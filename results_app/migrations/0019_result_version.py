@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0018_importjob_remove_missing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Incremented on every change; the mark autosave API rejects edits made against an older version.'),
+        ),
+    ]
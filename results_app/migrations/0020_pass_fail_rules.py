@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0019_result_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passfailresult',
+            name='is_overridden',
+            field=models.BooleanField(default=False, help_text='Set by hand; pass/fail rules leave it alone.'),
+        ),
+        migrations.CreateModel(
+            name='PassFailRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_class', models.IntegerField()),
+                ('min_subject_marks', models.FloatField(blank=True, help_text='Every subject of the class must be at least this mark.', null=True)),
+                ('min_total_percentage', models.FloatField(blank=True, help_text='The total must be at least this percentage of the maximum.', null=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pass_fail_rules', to='results_app.exam')),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pass_fail_rules', to='results_app.institution')),
+            ],
+            options={
+                'unique_together': {('institution', 'student_class', 'exam')},
+            },
+        ),
+    ]
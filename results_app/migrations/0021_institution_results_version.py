@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:20
+
+import results_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0020_pass_fail_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='institution',
+            name='results_version',
+            field=models.PositiveBigIntegerField(default=results_app.models.initial_results_version, editable=False, help_text='Bumped whenever anything shown on a published result changes; keys every cache derived from the results.'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:46
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def fail_duplicate_in_flight_jobs(apps, schema_editor):
+    # Keep the oldest of each group of identical in-flight jobs; the others
+    # could never have been told apart from it.
+    ImportJob = apps.get_model('results_app', 'ImportJob')
+    seen = set()
+    for job in ImportJob.objects.filter(status__in=['QUEUED', 'RUNNING']).order_by('created_at', 'id'):
+        key = (job.institution_id, job.kind, job.exam_id or 0, job.content_hash, job.remove_missing)
+        if key in seen:
+            ImportJob.objects.filter(id=job.id).update(status='FAILED', errors=job.errors + ['Duplicate of an earlier upload.'])
+        seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results_app', '0021_institution_results_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_in_flight_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='importjob',
+            constraint=models.UniqueConstraint(models.F('institution'), models.F('kind'), django.db.models.functions.comparison.Coalesce('exam', 0), models.F('content_hash'), models.F('remove_missing'), condition=models.Q(('status__in', ['QUEUED', 'RUNNING'])), name='unique_in_flight_import'),
+        ),
+    ]
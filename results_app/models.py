@@ -1,6 +1,17 @@
+import time
+
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 
+
+def initial_results_version():
+    # Seeded from the clock rather than 0 so that an institution whose id was
+    # used before (a rebuilt database, say) never starts at a version that
+    # is still cached.
+    return time.time_ns()
+
+
 class Institution(models.Model):
     GRADING_CHOICES = [
         ('10_POINT', '10-Point Scale (CBSE Style)'),
@@ -8,6 +19,7 @@ class Institution(models.Model):
         ('SUNNI_BOARD', 'Sunni Vidyabhyasa Board'),
         ('PERCENTAGE', 'Standard Percentage Only'),
         ('PASS_FAIL', 'Pass / Fail Only'),
+        ('CUSTOM', 'Custom Grading Scheme'),
     ]
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='institution')
     name = models.CharField(max_length=255)
@@ -15,10 +27,60 @@ class Institution(models.Model):
     is_approved = models.BooleanField(default=False)
     is_rejected = models.BooleanField(default=False)
     grading_system = models.CharField(max_length=20, choices=GRADING_CHOICES, default='PERCENTAGE')
+    grading_scheme = models.ForeignKey('GradingScheme', on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    results_version = models.PositiveBigIntegerField(default=initial_results_version, editable=False, help_text='Bumped whenever anything shown on a published result changes; keys every cache derived from the results.')
 
     def __str__(self):
         return f"{self.name} ({'Approved' if self.is_approved else 'Pending'})"
 
+    def save(self, *args, **kwargs):
+        # results_version is only ever bumped in the database; never write back
+        # a copy loaded before the last bump.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'results_version'
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def grading_key(self):
+        """
+        What to pass to calculate_grade: the grading_system code, or for a
+        custom scheme a key that changes with every edit of its bands.
+        """
+        if self.grading_system == 'CUSTOM' and self.grading_scheme_id:
+            return f"scheme:{self.grading_scheme_id}:{self.grading_scheme.version}"
+        return self.grading_system
+
+class GradingScheme(models.Model):
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='grading_schemes')
+    name = models.CharField(max_length=255)
+    version = models.PositiveIntegerField(default=1)  # bumped whenever a band changes
+
+    class Meta:
+        unique_together = ('institution', 'name')
+
+    def __str__(self):
+        return self.name
+
+class GradingBand(models.Model):
+    SCOPE_CHOICES = [
+        ('SUBJECT', 'Subject Marks'),
+        ('TOTAL', 'Total Marks'),
+    ]
+    scheme = models.ForeignKey(GradingScheme, on_delete=models.CASCADE, related_name='bands')
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES, default='SUBJECT')
+    min_percentage = models.FloatField()  # the lowest band of a scope also catches everything below it
+    grade = models.CharField(max_length=20)
+    grade_name = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        unique_together = ('scheme', 'scope', 'min_percentage')
+        ordering = ['scope', '-min_percentage']
+
+    def __str__(self):
+        return f"{self.grade} (>= {self.min_percentage}%)"
+
 class Student(models.Model):
     institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='students')
     name = models.CharField(max_length=255)
@@ -60,6 +122,7 @@ class Result(models.Model):
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='results')
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='results', null=True)
     marks = models.FloatField()
+    version = models.PositiveIntegerField(default=1, help_text='Incremented on every change; the mark autosave API rejects edits made against an older version.')
 
     class Meta:
         unique_together = ('student', 'subject', 'exam')
@@ -68,10 +131,18 @@ class Result(models.Model):
         exam_name = self.exam.name if self.exam else "Unassigned"
         return f"{self.student.name} - {self.subject.name} ({exam_name}): {self.marks}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
 class PassFailResult(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='pass_fail_results')
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='pass_fail_results', null=True)
     is_passed = models.BooleanField(default=False)
+    is_overridden = models.BooleanField(default=False, help_text='Set by hand; pass/fail rules leave it alone.')
 
     class Meta:
         unique_together = ('student', 'exam')
@@ -81,3 +152,125 @@ class PassFailResult(models.Model):
         status = "Passed" if self.is_passed else "Failed"
         return f"{self.student.name} ({exam_name}): {status}"
 
+class PassFailRule(models.Model):
+    """How PassFailResults of one class and exam are derived from the marks."""
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='pass_fail_rules')
+    student_class = models.IntegerField()
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='pass_fail_rules')
+    min_subject_marks = models.FloatField(blank=True, null=True, help_text='Every subject of the class must be at least this mark.')
+    min_total_percentage = models.FloatField(blank=True, null=True, help_text='The total must be at least this percentage of the maximum.')
+
+    class Meta:
+        unique_together = ('institution', 'student_class', 'exam')
+
+    def __str__(self):
+        return f"Class {self.student_class} ({self.exam.name})"
+
+    def passes(self, lowest, total, entered, subject_count):
+        """Whether a student with these marks passes; a subject without a mark fails the subject condition."""
+        if self.min_subject_marks is not None and (entered < subject_count or lowest < self.min_subject_marks):
+            return False
+        if self.min_total_percentage is not None and (not subject_count or total / subject_count < self.min_total_percentage):
+            return False
+        return True
+
+
+class ResultSnapshot(models.Model):
+    """
+    Denormalized, published copy of everything the public result page shows
+    for one student, so a lookup is a single indexed read.
+    """
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='result_snapshots')
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name='result_snapshot')
+    register_number = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    published_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('institution', 'register_number')
+
+    def __str__(self):
+        return f"Snapshot {self.register_number} ({self.institution.name})"
+
+class StudentExamSummary(models.Model):
+    """Per-student aggregate of one exam, kept up to date from Result writes."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='exam_summaries')
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='student_summaries')
+    student_class = models.IntegerField()
+    total = models.FloatField(default=0)
+    max_total = models.FloatField(default=0)
+    subjects_entered = models.PositiveIntegerField(default=0)
+    has_failed_subject = models.BooleanField(default=False)
+    is_passed = models.BooleanField(default=False)
+    # Ranks are None when the student is excluded from ranking
+    rank = models.PositiveIntegerField(blank=True, null=True)
+    dense_rank = models.PositiveIntegerField(blank=True, null=True)
+    division_rank = models.PositiveIntegerField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('student', 'exam')
+        indexes = [models.Index(fields=['exam', 'student_class', 'rank'])]
+
+    def __str__(self):
+        return f"{self.student.name} ({self.exam.name}): {self.total}"
+
+class ClassExamSummary(models.Model):
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='class_summaries')
+    student_class = models.IntegerField()
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='class_summaries')
+    student_count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    pass_count = models.PositiveIntegerField(default=0)
+    topper_total = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('institution', 'student_class', 'exam')
+
+    def __str__(self):
+        return f"Class {self.student_class} ({self.exam.name})"
+
+class ImportJob(models.Model):
+    """An uploaded sheet queued for processing outside the request."""
+    KIND_CHOICES = [
+        ('RESULTS', 'Marks Upload'),
+        ('STUDENTS', 'Student Upload'),
+    ]
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, related_name='import_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED', db_index=True)
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='import_jobs', blank=True, null=True)
+    file = models.FileField(upload_to='imports/%Y/%m/', blank=True)
+    original_name = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 of the uploaded file.")
+    remove_missing = models.BooleanField(default=False, help_text="Student uploads: delete students of the listed classes who are not in the file.")
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    summary = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # At most one in-flight job per identical upload. Coalesce makes
+            # student uploads (no exam) collide too: NULLs never do.
+            models.UniqueConstraint(
+                'institution', 'kind', Coalesce('exam', 0), 'content_hash', 'remove_missing',
+                condition=models.Q(status__in=['QUEUED', 'RUNNING']),
+                name='unique_in_flight_import',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('DONE', 'FAILED')
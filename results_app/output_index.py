@@ -0,0 +1,42 @@
+"""
+Incremental output directories: the marksheet PDFs and the static result site.
+
+A directory keeps an index.json mapping each register number to the file
+rendered for it and a hash of the data it was rendered from, so a rerun only
+renders what changed. Like marksheet_pdf.py, this module must not import
+Django: spawned pool workers import it to write their files.
+"""
+import hashlib
+import json
+import os
+
+INDEX_NAME = 'index.json'
+
+
+def content_hash(data):
+    """Stable hash of JSON-serializable data."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def write_atomic(path, content):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def load_index(out_dir):
+    index_path = os.path.join(out_dir, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def save_index(out_dir, index):
+    write_atomic(os.path.join(out_dir, INDEX_NAME), json.dumps(index, sort_keys=True).encode())
+
+
+def needs_render(out_dir, previous, entry, force=False):
+    """Whether the file of `entry` ({'path', 'hash', ...}) must be rendered again."""
+    return force or previous != entry or not os.path.exists(os.path.join(out_dir, entry['path']))
@@ -0,0 +1,122 @@
+"""
+Rule-based pass/fail results.
+
+A PassFailRule gives the pass conditions of one class and exam: every subject
+at or above a mark, the total at or above a percentage, or both. apply_rule
+aggregates the class's marks per student in one query, decides every
+student at once and writes the outcomes with one bulk upsert. Results set by
+hand (is_overridden) are left alone, so after applying a rule staff only
+review the exceptions. Rules are re-applied to the affected students when
+their marks change (see signals.py).
+"""
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+
+from .models import Subject, Result, PassFailResult
+from .signals import batched_results_changes
+
+
+def rule_outcomes(rule, student_ids=None):
+    """
+    {student_id: {'is_passed', 'percentage'}} under `rule`, for the students of
+    the class with at least one mark in the exam (or only those in `student_ids`).
+    """
+    subject_count = Subject.objects.filter(institution_id=rule.institution_id, student_class=rule.student_class).count()
+    results = Result.objects.filter(
+        exam_id=rule.exam_id,
+        student__institution_id=rule.institution_id,
+        student__student_class=rule.student_class,
+        subject__student_class=rule.student_class,
+    )
+    if student_ids is not None:
+        results = results.filter(student_id__in=student_ids)
+    rows = results.values('student_id').annotate(lowest=Min('marks'), total=Sum('marks'), entered=Count('id')).order_by()
+    return {
+        row['student_id']: {
+            'is_passed': rule.passes(row['lowest'], row['total'], row['entered'], subject_count),
+            'percentage': row['total'] / subject_count if subject_count else 0,
+        }
+        for row in rows
+    }
+
+
+def _class_results(rule, student_ids=None):
+    results = PassFailResult.objects.filter(
+        exam_id=rule.exam_id, student__institution_id=rule.institution_id, student__student_class=rule.student_class,
+    )
+    if student_ids is not None:
+        results = results.filter(student_id__in=student_ids)
+    return results
+
+
+def _write(exam_id, results, delete_ids):
+    """One bulk upsert and one delete of PassFailResults, notifying listeners once."""
+    with transaction.atomic(), batched_results_changes(sender=PassFailResult) as batch:
+        if results:
+            PassFailResult.objects.bulk_create(
+                results,
+                update_conflicts=True,
+                unique_fields=['student', 'exam'],
+                update_fields=['is_passed', 'is_overridden'],
+            )
+            batch.add({r.student_id for r in results}, [exam_id])
+        if delete_ids:
+            PassFailResult.objects.filter(id__in=delete_ids).delete()
+
+
+def apply_rule(rule, student_ids=None, reset_overrides=False):
+    """
+    Bring the class's PassFailResults (or those of `student_ids`) in line with
+    `rule`. Overridden results are kept unless `reset_overrides`; derived
+    results of students who no longer have any marks are removed. Returns
+    counts of passed, failed, changed and overridden students.
+    """
+    outcomes = rule_outcomes(rule, student_ids)
+    existing = {r.student_id: r for r in _class_results(rule, student_ids).only('id', 'student_id', 'is_passed', 'is_overridden')}
+
+    writes = []
+    delete_ids = []
+    overridden = 0
+    for student_id, outcome in outcomes.items():
+        current = existing.get(student_id)
+        if current is not None and current.is_overridden and not reset_overrides:
+            overridden += 1
+        elif current is None or current.is_passed != outcome['is_passed'] or current.is_overridden:
+            writes.append(PassFailResult(student_id=student_id, exam_id=rule.exam_id, is_passed=outcome['is_passed']))
+    for student_id, current in existing.items():
+        if student_id not in outcomes and (reset_overrides or not current.is_overridden):
+            delete_ids.append(current.id)
+    if writes or delete_ids:
+        _write(rule.exam_id, writes, delete_ids)
+
+    passed = sum(1 for outcome in outcomes.values() if outcome['is_passed'])
+    return {'passed': passed, 'failed': len(outcomes) - passed, 'changed': len(writes) + len(delete_ids), 'overridden': overridden}
+
+
+def save_manual_results(exam, statuses, existing, rule=None):
+    """
+    Save pass/fail statuses chosen by staff: {student_id: True, False or None}.
+    A status that differs from the rule's outcome (or any status when there is
+    no rule) is an override the rule will not touch; None hands the student
+    back to the rule, or clears the result when the rule has no outcome for
+    them. `existing` maps student ids to their current PassFailResult.
+    """
+    outcomes = rule_outcomes(rule, list(statuses)) if rule else {}
+    writes = []
+    delete_ids = []
+    for student_id, is_passed in statuses.items():
+        current = existing.get(student_id)
+        outcome = outcomes.get(student_id)
+        if is_passed is None:
+            if outcome is None:
+                if current is not None:
+                    delete_ids.append(current.id)
+                continue
+            is_passed, is_overridden = outcome['is_passed'], False
+        else:
+            is_overridden = outcome is None or outcome['is_passed'] != is_passed
+        if current is None or (current.is_passed, current.is_overridden) != (is_passed, is_overridden):
+            writes.append(PassFailResult(student_id=student_id, exam_id=exam.id, is_passed=is_passed, is_overridden=is_overridden))
+    if writes or delete_ids:
+        _write(exam.id, writes, delete_ids)
+    return len(writes), len(delete_ids)
@@ -0,0 +1,78 @@
+"""
+A minimal pure-Python PDF writer: text in the standard Helvetica fonts,
+lines and filled boxes on A4 pages, with zlib-compressed content streams.
+Enough for printable marksheets without an HTML-to-PDF dependency. The
+standard fonts only cover Windows-1252; other characters print as '?'.
+"""
+import zlib
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+
+FONTS = {False: 'F1', True: 'F2'}
+
+
+def _escape(text):
+    data = str(text).encode('cp1252', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def text_width(text, size):
+    # Helvetica averages ~0.5em per character; close enough for centring and clipping.
+    return len(str(text)) * size * 0.5
+
+
+class PdfDocument:
+    def __init__(self):
+        self.pages = []
+        self._ops = []
+
+    def text(self, x, y, text, size=10, bold=False):
+        self._ops.append(b'BT /%s %d Tf %.2f %.2f Td (%s) Tj ET' % (
+            FONTS[bold].encode(), size, x, y, _escape(text),
+        ))
+
+    def line(self, x1, y1, x2, y2, width=0.5):
+        self._ops.append(b'%.2f w %.2f %.2f m %.2f %.2f l S' % (width, x1, y1, x2, y2))
+
+    def box(self, x, y, width, height, gray=0.9):
+        self._ops.append(b'q %.2f g %.2f %.2f %.2f %.2f re f Q' % (gray, x, y, width, height))
+
+    def new_page(self):
+        self.pages.append(b'\n'.join(self._ops))
+        self._ops = []
+
+    def tobytes(self):
+        if self._ops or not self.pages:
+            self.new_page()
+
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            None,  # the page tree, once the page object numbers are known
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        ]
+        page_numbers = []
+        for content in self.pages:
+            stream = zlib.compress(content)
+            objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream))
+            objects.append(
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+                % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+            )
+            page_numbers.append(len(objects))
+        kids = b' '.join(b'%d 0 R' % n for n in page_numbers)
+        objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_numbers))
+
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        xref = len(out)
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        for offset in offsets:
+            out += b'%010d 00000 n \n' % offset
+        out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+        return bytes(out)
@@ -0,0 +1,95 @@
+"""
+Class rank and percentile lookups for the public result page.
+
+A RankIndex holds the ranks of one (institution, class, exam) as stored in
+StudentExamSummary, which ranks with the same ordering and tie-breakers as
+the rank list: student ids sorted in one array('q') with their ranks
+alongside, and the ranks sorted in another, so a student's rank and
+percentile are two bisects. Indexes are built lazily in one query (filling
+in missing summaries the way the rank list does) and kept in process
+memory, tagged with the institution's results version: any change to its
+results bumps the version, and the next lookup rebuilds.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .cache import get_results_version
+from .models import Exam, ClassExamSummary, StudentExamSummary
+from .summaries import get_class_summary
+
+MAX_INDEXES = 512
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+class RankIndex:
+    def __init__(self, rows):
+        """`rows` are (student_id, rank or None) for everyone in the class who sat the exam."""
+        rows = list(rows)
+        self.class_size = len(rows)
+        ranked = sorted((student_id, rank) for student_id, rank in rows if rank is not None)
+        self.student_ids = array('q', [student_id for student_id, _ in ranked])
+        self.ranks = array('q', [rank for _, rank in ranked])
+        self.sorted_ranks = array('q', sorted(self.ranks))
+
+    def __len__(self):
+        return self.class_size
+
+    def lookup(self, student_id):
+        """
+        (rank, percentile) of a ranked student, else None. Students sharing a
+        rank share a percentile: the share of the class ranked at or below
+        them, counting students excluded from ranking as below everyone.
+        """
+        i = bisect_left(self.student_ids, student_id)
+        if i == len(self.student_ids) or self.student_ids[i] != student_id:
+            return None
+        rank = self.ranks[i]
+        at_or_below = self.class_size - bisect_left(self.sorted_ranks, rank)
+        return rank, at_or_below * 100 / self.class_size
+
+
+def get_rank_index(institution, student_class, exam_id):
+    version = get_results_version(institution.id)
+    key = (institution.id, student_class, exam_id)
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(key)
+            return entry[1]
+
+    if not ClassExamSummary.objects.filter(institution=institution, student_class=student_class, exam_id=exam_id).exists():
+        get_class_summary(institution, student_class, Exam.objects.get(id=exam_id))
+    # Students excluded from ranking (SUNNI_BOARD failures) have no rank but
+    # still count towards the class size.
+    index = RankIndex(StudentExamSummary.objects.filter(
+        exam_id=exam_id, student_class=student_class,
+    ).values_list('student_id', 'rank'))
+    with _lock:
+        _indexes[key] = (version, index)
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def add_class_ranks(institution, payload):
+    """
+    The exams of a snapshot payload with 'rank', 'percentile' and
+    'class_size' added where the student is ranked.
+    """
+    if institution.grading_system == 'PASS_FAIL':
+        return payload['exams']
+    student = payload['student']
+    exams = []
+    for exam in payload['exams']:
+        if exam.get('exam_id'):
+            index = get_rank_index(institution, student['student_class'], exam['exam_id'])
+            found = index.lookup(student['id'])
+            if found is not None:
+                exam = {**exam, 'rank': found[0], 'percentile': found[1], 'class_size': len(index)}
+        exams.append(exam)
+    return exams
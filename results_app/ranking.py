@@ -0,0 +1,65 @@
+"""
+Window-function ranking engine.
+
+Ranks a class for an exam in one query: marks are aggregated per student
+(the SUNNI_BOARD fail rule is a conditional Count, applied as HAVING before
+ranking) and RANK(), DENSE_RANK() and a per-division RANK() are computed by
+the database over the total plus any configured tie-breakers.
+"""
+from django.conf import settings
+from django.db.models import Count, F, Max, Q, Sum, Window
+from django.db.models.functions import DenseRank, Rank
+
+from .matrix import SUNNI_BOARD_PASS_MARK
+from .models import Result
+
+# Tie-breakers that may be listed in settings.RANK_TIE_BREAKERS, applied in
+# order after the total: (expression to order by, descending).
+TIE_BREAKERS = {
+    'highest_subject_mark': ('best_mark', True),
+    'most_subjects': ('subjects_entered', True),
+    'register_number': ('student__register_number', False),
+    'name': ('student__name', False),
+}
+
+
+def get_tie_breakers():
+    names = getattr(settings, 'RANK_TIE_BREAKERS', [])
+    unknown = [name for name in names if name not in TIE_BREAKERS]
+    if unknown:
+        raise ValueError(f"Unknown rank tie-breaker(s): {', '.join(unknown)}")
+    return names
+
+
+def _order_by(tie_breakers):
+    order_by = [F('total').desc()]
+    for name in tie_breakers:
+        field, descending = TIE_BREAKERS[name]
+        order_by.append(F(field).desc() if descending else F(field).asc())
+    return order_by
+
+
+def rank_class(exam_id, student_class, exclude_failed=False, tie_breakers=None):
+    """
+    Rank the students of a class for an exam. Returns
+    {student_id: (rank, dense_rank, division_rank)}; students excluded by
+    the fail rule are absent.
+    """
+    if tie_breakers is None:
+        tie_breakers = get_tie_breakers()
+    rows = Result.objects.filter(exam_id=exam_id, student__student_class=student_class).values(
+        'student_id', 'student__division',
+    ).annotate(
+        total=Sum('marks'),
+        subjects_entered=Count('id'),
+        best_mark=Max('marks'),
+        failed_subjects=Count('id', filter=Q(marks__lt=SUNNI_BOARD_PASS_MARK)),
+    )
+    if exclude_failed:
+        rows = rows.filter(failed_subjects=0)
+    rows = rows.annotate(
+        rank=Window(Rank(), order_by=_order_by(tie_breakers)),
+        dense_rank=Window(DenseRank(), order_by=_order_by(tie_breakers)),
+        division_rank=Window(Rank(), partition_by=[F('student__division')], order_by=_order_by(tie_breakers)),
+    )
+    return {row['student_id']: (row['rank'], row['dense_rank'], row['division_rank']) for row in rows}
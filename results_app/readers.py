@@ -0,0 +1,250 @@
+"""
+Streaming readers for uploaded sheets.
+
+Every supported format is read lazily and handed on as DataFrame chunks of a
+bounded number of rows, so memory stays flat however large the file is:
+
+- .xlsx through openpyxl read-only mode, .xls through xlrd (if installed)
+- .csv / .tsv through pandas' chunked CSV reader
+- .parquet one record batch at a time through pyarrow (if installed)
+
+Cells are normalized on the way: strings are stripped, empty cells become ''
+and fully empty rows are dropped. Chunks are indexed by sheet row number
+(the header being row 1) so problems can be reported against the file.
+"""
+import pandas as pd
+
+DEFAULT_CHUNK_ROWS = 1000
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.tsv', '.parquet')
+UNSUPPORTED_FILE_MESSAGE = 'Please upload an Excel (.xlsx, .xls), CSV (.csv, .tsv) or Parquet (.parquet) file.'
+
+
+class SheetReadError(ValueError):
+    pass
+
+
+def is_supported_file(filename):
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def _normalize(value):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, float) and value.is_integer():
+        # xlrd reads every number as a float, and so does pyarrow for a
+        # numeric Parquet column with gaps; register number 1001 must not
+        # become '1001.0'. pd.read_excel did the same.
+        return int(value)
+    return value
+
+
+def _header(row):
+    # Blank header cells get pandas-style names so they are ignored as subjects.
+    return [str(_normalize(v)) if _normalize(v) != '' else f'Unnamed: {i}' for i, v in enumerate(row)]
+
+
+def _normalize_frame(df):
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(_normalize)
+    return df[(df != '').any(axis=1)]
+
+
+class SheetReader:
+    """
+    A lazily read sheet. `estimated_rows` is the number of data rows the file
+    declares (used for progress only) and `chunks()` yields DataFrames of at
+    most `chunk_rows` rows.
+    """
+    estimated_rows = 0
+
+    def chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RowSheetReader(SheetReader):
+    """Excel sheets, read one row tuple at a time."""
+
+    def __init__(self, header, rows, estimated_rows, close=None):
+        self.header = header
+        self._rows = rows
+        self.estimated_rows = estimated_rows
+        self._close = close
+
+    def chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        width = len(self.header)
+        chunk = []
+        numbers = []
+        try:
+            for number, row in enumerate(self._rows, start=2):
+                row = tuple(_normalize(v) for v in row[:width])
+                if not any(v != '' for v in row):
+                    continue
+                if len(row) < width:
+                    row += ('',) * (width - len(row))
+                chunk.append(row)
+                numbers.append(number)
+                if len(chunk) >= chunk_rows:
+                    yield pd.DataFrame.from_records(chunk, columns=self.header, index=numbers)
+                    chunk = []
+                    numbers = []
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns=self.header, index=numbers)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._close:
+            self._close()
+            self._close = None
+
+
+class CsvSheetReader(SheetReader):
+    """Comma or tab separated text, read with pandas in chunks of text cells."""
+
+    def __init__(self, f, sep):
+        self.f = f
+        self.sep = sep
+        self.estimated_rows = max(self._count_lines() - 1, 0)
+
+    def _count_lines(self):
+        lines = 0
+        last = b'\n'
+        for block in iter(lambda: self.f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+        self.f.seek(0)
+        return lines + (last != b'\n')
+
+    def chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        try:
+            reader = pd.read_csv(self.f, sep=self.sep, chunksize=chunk_rows, dtype=str,
+                                 keep_default_na=False, encoding='utf-8-sig', skip_blank_lines=False)
+            for df in reader:
+                df.columns = _header(df.columns)
+                # Blank lines are read (then dropped) so the index stays the line number.
+                df.index = df.index + 2
+                df = _normalize_frame(df)
+                if len(df):
+                    yield df
+        except (UnicodeDecodeError, pd.errors.ParserError) as e:
+            raise SheetReadError(f'Could not read the file: {e}')
+
+
+class ParquetSheetReader(SheetReader):
+    """Parquet files, read one record batch (at most one row group) at a time."""
+
+    def __init__(self, f):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SheetReadError('Reading .parquet files requires the "pyarrow" package; please upload a CSV or Excel file instead.')
+        try:
+            self.parquet = pq.ParquetFile(f)
+        except Exception as e:
+            raise SheetReadError(f'Could not read the Parquet file: {e}')
+        self.estimated_rows = self.parquet.metadata.num_rows
+
+    def chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        start = 2
+        try:
+            # iter_batches fills a batch across row group boundaries unless
+            # it is given one row group at a time.
+            batches = (
+                batch
+                for row_group in range(self.parquet.num_row_groups)
+                for batch in self.parquet.iter_batches(batch_size=chunk_rows, row_groups=[row_group])
+            )
+            for batch in batches:
+                # Keep integer register numbers as ints rather than NaN-widened floats.
+                df = batch.to_pandas(integer_object_nulls=True)
+                df.columns = _header(df.columns)
+                df.index = pd.RangeIndex(start, start + len(df))
+                start += len(df)
+                df = _normalize_frame(df.astype(object).where(df.notna(), ''))
+                if len(df):
+                    yield df
+        finally:
+            self.close()
+
+    def close(self):
+        self.parquet.close()
+
+
+def _load_xlsx(f):
+    from openpyxl import load_workbook
+
+    return load_workbook(f, read_only=True, data_only=True)
+
+
+def _load_xls(f):
+    try:
+        import xlrd
+    except ImportError:
+        raise SheetReadError('Reading .xls files requires the "xlrd" package; please upload an .xlsx file instead.')
+    # xlrd needs the whole file; on_demand keeps unused sheets unparsed.
+    return xlrd.open_workbook(file_contents=f.read(), on_demand=True)
+
+
+def open_xlsx(f, sheet=None):
+    workbook = _load_xlsx(f)
+    worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+    rows = worksheet.iter_rows(values_only=True)
+    header = _header(next(rows, ()))
+    return RowSheetReader(header, rows, max((worksheet.max_row or 1) - 1, 0), close=workbook.close)
+
+
+def open_xls(f, sheet=None):
+    book = _load_xls(f)
+    worksheet = book.sheet_by_name(sheet) if sheet is not None else book.sheet_by_index(0)
+    rows = (worksheet.row_values(i) for i in range(1, worksheet.nrows))
+    header = _header(worksheet.row_values(0)) if worksheet.nrows else []
+    return RowSheetReader(header, rows, max(worksheet.nrows - 1, 0), close=book.release_resources)
+
+
+def open_sheet(f, filename, sheet=None):
+    """Open an uploaded file by extension; `sheet` names a workbook sheet (default: the first)."""
+    name = filename.lower()
+    if name.endswith('.xlsx'):
+        return open_xlsx(f, sheet)
+    if name.endswith('.xls'):
+        return open_xls(f, sheet)
+    if name.endswith('.csv'):
+        return CsvSheetReader(f, ',')
+    if name.endswith('.tsv'):
+        return CsvSheetReader(f, '\t')
+    if name.endswith('.parquet'):
+        return ParquetSheetReader(f)
+    raise SheetReadError(UNSUPPORTED_FILE_MESSAGE)
+
+
+def workbook_sheets(f, filename):
+    """
+    [(sheet name, estimated data rows)] for Excel workbooks, or None for
+    single-sheet formats. Only sheet dimensions are read, not the rows.
+    """
+    name = filename.lower()
+    if name.endswith('.xlsx'):
+        workbook = _load_xlsx(f)
+        try:
+            return [(ws.title, max((ws.max_row or 1) - 1, 0)) for ws in workbook.worksheets]
+        finally:
+            workbook.close()
+    if name.endswith('.xls'):
+        book = _load_xls(f)
+        try:
+            return [(ws.name, max(ws.nrows - 1, 0)) for ws in book.sheets()]
+        finally:
+            book.release_resources()
+    return None
+
+
+def read_sheet(path, filename, sheet, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """All chunks of one sheet of the file at `path`; runs in worker processes."""
+    with open(path, 'rb') as f:
+        return list(open_sheet(f, filename, sheet).chunks(chunk_rows))
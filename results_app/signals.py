@@ -0,0 +1,235 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import Signal, receiver
+
+from .models import Institution, GradingScheme, GradingBand, Student, Subject, Exam, Result, PassFailResult, PassFailRule, ClassExamSummary, StudentExamSummary
+from .snapshots import refresh_snapshots
+from .cache import bump_results_version
+from .summaries import refresh_student_summaries, refresh_class_summary
+
+# Sent whenever something a student's published result depends on changes.
+# Bulk write paths that bypass model signals (bulk_create, queryset.update)
+# must send this themselves.
+# Arguments: student_ids, exam_ids (None means "any exam").
+results_changed = Signal()
+
+_batches = threading.local()
+
+
+class ResultsChangedBatch:
+    def __init__(self):
+        self.student_ids = set()
+        self.exam_ids = set()
+        self.all_exams = False
+        # (institution_id, student_class) pairs that lost students.
+        self.shrunk_classes = set()
+
+    def add(self, student_ids, exam_ids=None):
+        self.student_ids.update(student_ids)
+        if exam_ids is None:
+            self.all_exams = True
+        else:
+            self.exam_ids.update(exam_ids)
+
+
+@contextmanager
+def batched_results_changes(sender=Result):
+    """
+    Collect the results_changed notifications of per-row Result and
+    PassFailResult signals inside the block (plus anything passed to the
+    yielded batch's add()) and send them once on exit, so a batch of writes
+    refreshes snapshots and summaries once instead of once per row. Wrap
+    deletes that cascade to results (subjects, students) in it too; class
+    summaries of classes that lost students are refreshed once per class.
+    """
+    batch = ResultsChangedBatch()
+    outer = getattr(_batches, 'current', None)
+    _batches.current = batch
+    try:
+        yield batch
+    finally:
+        _batches.current = outer
+    if batch.student_ids:
+        results_changed.send(
+            sender=sender, student_ids=batch.student_ids,
+            exam_ids=None if batch.all_exams else batch.exam_ids,
+        )
+    for institution_id, student_class in batch.shrunk_classes:
+        _class_shrunk(institution_id, student_class)
+
+
+@receiver(post_save, sender=Result)
+@receiver(post_delete, sender=Result)
+@receiver(post_save, sender=PassFailResult)
+@receiver(post_delete, sender=PassFailResult)
+def result_saved_or_deleted(sender, instance, origin=None, **kwargs):
+    # Results deleted along with their student or institution take that
+    # student's snapshot and summaries with them, and an exam's summaries go
+    # with the exam; refreshing per row would recreate rows pointing at the
+    # objects being deleted. Exam deletes refresh snapshots in exam_deleted.
+    if origin is not None and not _deleted_from(origin, (Result, PassFailResult, Subject)):
+        return
+    batch = getattr(_batches, 'current', None)
+    if batch is not None:
+        batch.add([instance.student_id], [instance.exam_id])
+        return
+    results_changed.send(sender=sender, student_ids=[instance.student_id], exam_ids=[instance.exam_id])
+
+
+def _deleted_from(origin, models):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, **kwargs):
+    results_changed.send(sender=sender, student_ids=[instance.id], exam_ids=None)
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, origin=None, **kwargs):
+    # When the institution itself is going, its class summaries go too.
+    if origin is not None and not _deleted_from(origin, (Student,)):
+        return
+    batch = getattr(_batches, 'current', None)
+    if batch is not None:
+        batch.shrunk_classes.add((instance.institution_id, instance.student_class))
+        return
+    _class_shrunk(instance.institution_id, instance.student_class)
+
+
+def _class_shrunk(institution_id, student_class):
+    bump_results_version(institution_id)
+    # Classmates' ranks and the class summaries no longer include the removed students.
+    exam_ids = ClassExamSummary.objects.filter(
+        institution_id=institution_id, student_class=student_class,
+    ).values_list('exam_id', flat=True)
+    for exam_id in list(exam_ids):
+        refresh_class_summary(institution_id, student_class, exam_id)
+
+
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Exam)
+def institution_data_deleted(sender, instance, **kwargs):
+    bump_results_version(instance.institution_id)
+
+
+@receiver(pre_delete, sender=Exam)
+def exam_deleting(sender, instance, origin=None, **kwargs):
+    # When the institution itself is going, its students' snapshots go too.
+    if origin is not None and not _deleted_from(origin, (Exam,)):
+        return
+    student_ids = set(Result.objects.filter(exam=instance).values_list('student_id', flat=True))
+    student_ids.update(PassFailResult.objects.filter(exam=instance).values_list('student_id', flat=True))
+    instance._affected_student_ids = student_ids
+
+
+@receiver(post_delete, sender=Exam)
+def exam_deleted(sender, instance, **kwargs):
+    # The exam's results and summaries cascade away without refreshing
+    # anything; drop the exam from the published snapshots in one batch.
+    # Result.exam is nullable, so the collector may delete the exam before
+    # its results: wait until the whole delete has committed.
+    student_ids = getattr(instance, '_affected_student_ids', None)
+    if student_ids:
+        transaction.on_commit(lambda: refresh_snapshots(student_ids))
+
+
+@receiver(post_save, sender=Institution)
+def institution_saved(sender, instance, **kwargs):
+    # Covers grading_system changes as well as name and approval changes,
+    # all of which show up on the public result page.
+    bump_results_version(instance.id)
+
+
+@receiver(post_save, sender=GradingBand)
+@receiver(post_delete, sender=GradingBand)
+def grading_band_changed(sender, instance, **kwargs):
+    # A new version gives the scheme a new grading_key, which misses the
+    # compiled-scheme cache and marks published snapshots as stale.
+    GradingScheme.objects.filter(id=instance.scheme_id).update(version=F('version') + 1)
+    for institution_id in Institution.objects.filter(grading_scheme_id=instance.scheme_id).values_list('id', flat=True):
+        bump_results_version(institution_id)
+
+
+@receiver(pre_delete, sender=GradingScheme)
+def grading_scheme_deleted(sender, instance, **kwargs):
+    for institution_id in Institution.objects.filter(grading_scheme=instance).values_list('id', flat=True):
+        bump_results_version(institution_id)
+
+
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, created, **kwargs):
+    bump_results_version(instance.institution_id)
+    _class_subjects_changed(instance)
+    if created:
+        return
+    student_ids = Result.objects.filter(subject=instance).values_list('student_id', flat=True).distinct()
+    results_changed.send(sender=sender, student_ids=list(student_ids), exam_ids=None)
+
+
+@receiver(post_delete, sender=Subject)
+def subject_deleted(sender, instance, origin=None, **kwargs):
+    if origin is not None and not _deleted_from(origin, (Subject,)):
+        return
+    _class_subjects_changed(instance)
+
+
+def _class_subjects_changed(subject):
+    # Summary totals are out of the class's subjects, so every summary of
+    # the class changes with them, marks or not.
+    student_ids = StudentExamSummary.objects.filter(
+        exam__institution_id=subject.institution_id, student_class=subject.student_class,
+    ).values_list('student_id', flat=True).distinct()
+    refresh_student_summaries(list(student_ids))
+    # So do the class's pass/fail rules, which count its subjects too.
+    from .pass_fail import apply_rule
+    for rule in PassFailRule.objects.filter(institution_id=subject.institution_id, student_class=subject.student_class):
+        apply_rule(rule)
+
+
+@receiver(post_save, sender=Exam)
+def exam_saved(sender, instance, created, **kwargs):
+    bump_results_version(instance.institution_id)
+    if created:
+        return
+    student_ids = set(Result.objects.filter(exam=instance).values_list('student_id', flat=True))
+    student_ids.update(PassFailResult.objects.filter(exam=instance).values_list('student_id', flat=True))
+    results_changed.send(sender=sender, student_ids=list(student_ids), exam_ids=[instance.id])
+
+
+@receiver(results_changed)
+def refresh_result_snapshots(sender, student_ids, **kwargs):
+    refresh_snapshots(student_ids)
+
+
+@receiver(results_changed)
+def bump_institution_results_versions(sender, student_ids, **kwargs):
+    institution_ids = Student.objects.filter(id__in=student_ids).values_list('institution_id', flat=True).distinct()
+    for institution_id in institution_ids:
+        bump_results_version(institution_id)
+
+
+@receiver(results_changed)
+def refresh_exam_summaries(sender, student_ids, exam_ids=None, **kwargs):
+    refresh_student_summaries(student_ids, exam_ids)
+
+
+@receiver(results_changed)
+def reapply_pass_fail_rules(sender, student_ids, exam_ids=None, **kwargs):
+    # Pass/fail writes, including the rules' own, never change the marks.
+    if sender is PassFailResult:
+        return
+    from .pass_fail import apply_rule
+    rules = PassFailRule.objects.filter(
+        institution__students__id__in=student_ids,
+        institution__students__student_class=F('student_class'),
+    )
+    if exam_ids is not None:
+        rules = rules.filter(exam_id__in=exam_ids)
+    for rule in rules.distinct():
+        apply_rule(rule, student_ids)
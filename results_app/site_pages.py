@@ -0,0 +1,37 @@
+"""
+Static result page rendering for pool workers.
+
+Like marksheet_pdf.py, this module must not import Django at import time:
+export_result_site renders in spawned processes, which unpickle the worker
+functions by importing this module before Django is set up. init_worker sets
+it up (from the inherited DJANGO_SETTINGS_MODULE); rendering itself needs no
+database, and the institution arrives as a plain dict.
+"""
+import gzip
+import os
+
+from .output_index import write_atomic
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def render_pages(institution, out_dir, batch):
+    """Render [(student, exams, filename)] and write each page plus a .gz sibling."""
+    from django.template.loader import render_to_string
+
+    from .forms import StudentSearchForm
+
+    for student, exams, filename in batch:
+        html = render_to_string('student_result.html', {
+            'form': StudentSearchForm(),
+            'results_by_exam': {exam['name']: exam for exam in exams},
+            'student': student,
+            'institution': institution,
+        }).encode()
+        path = os.path.join(out_dir, filename)
+        write_atomic(path, html)
+        write_atomic(f'{path}.gz', gzip.compress(html, mtime=0))
+    return len(batch)
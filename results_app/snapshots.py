@@ -0,0 +1,135 @@
+from django.db.models import Prefetch
+
+from .models import Student, Result, PassFailResult, ResultSnapshot
+from .utils import calculate_grade
+
+
+def build_snapshot_payload(student):
+    """
+    Serialize everything student_result_view shows for `student` into a
+    JSON-friendly dict. Expects `student.institution`, `student.results`
+    and `student.pass_fail_results` to be prefetched where possible.
+    """
+    institution = student.institution
+    grading_system = institution.grading_system
+    grading_key = institution.grading_key
+    exams = {}
+
+    if grading_system == 'PASS_FAIL':
+        for r in student.pass_fail_results.all():
+            exam_name = r.exam.name if r.exam else "General Exam"
+            exams[exam_name] = {'exam_id': r.exam_id, 'name': exam_name, 'is_passed': r.is_passed}
+    else:
+        for r in student.results.all():
+            exam_name = r.exam.name if r.exam else "General Exam"
+            if exam_name not in exams:
+                exams[exam_name] = {'exam_id': r.exam_id, 'name': exam_name, 'marks': [], 'total': 0, 'max_total': 0, 'has_failed_subject': False}
+            exam_data = exams[exam_name]
+            exam_data['marks'].append({
+                'subject': r.subject.name,
+                'marks': r.marks,
+                'grade': calculate_grade(r.marks, 100, grading_key)[0],
+            })
+            exam_data['total'] += r.marks
+            exam_data['max_total'] += 100
+
+            if grading_system == 'SUNNI_BOARD' and r.marks < 40:
+                exam_data['has_failed_subject'] = True
+
+        for exam_data in exams.values():
+            exam_data['total_grade_name'] = calculate_grade(exam_data['total'], exam_data['max_total'], grading_key, is_total=True)[1]
+
+    return {
+        'grading_key': grading_key,
+        'student': {
+            'id': student.id,
+            'name': student.name,
+            'fathers_name': student.fathers_name,
+            'register_number': student.register_number,
+            'student_class': student.student_class,
+            'division': student.division,
+        },
+        'exams': list(exams.values()),
+    }
+
+
+def is_snapshot_stale(snapshot, institution):
+    return snapshot.payload.get('grading_key') != institution.grading_key
+
+
+def _students_for_snapshot(student_ids):
+    return Student.objects.filter(id__in=student_ids).select_related('institution', 'institution__grading_scheme').prefetch_related(
+        Prefetch('results', queryset=Result.objects.select_related('exam', 'subject').order_by('id')),
+        Prefetch('pass_fail_results', queryset=PassFailResult.objects.select_related('exam').order_by('id')),
+    )
+
+
+def refresh_snapshots(student_ids, batch_size=500):
+    """
+    (Re)publish the snapshots of the given students, a constant number of
+    queries per batch. Returns the list of written ResultSnapshot objects.
+    """
+    student_ids = list(set(student_ids))
+    written = []
+    for i in range(0, len(student_ids), batch_size):
+        written.extend(_refresh_snapshot_batch(student_ids[i:i + batch_size]))
+    return written
+
+
+def _refresh_snapshot_batch(student_ids):
+    snapshots = [
+        ResultSnapshot(
+            institution_id=student.institution_id,
+            student=student,
+            register_number=student.register_number,
+            payload=build_snapshot_payload(student),
+        )
+        for student in _students_for_snapshot(student_ids)
+    ]
+    # A snapshot's register number may have been taken over by another
+    # student since it was last published; drop it before re-inserting.
+    register_numbers = {}
+    for s in snapshots:
+        register_numbers.setdefault(s.institution_id, []).append(s.register_number)
+    for institution_id, numbers in register_numbers.items():
+        ResultSnapshot.objects.filter(
+            institution_id=institution_id, register_number__in=numbers,
+        ).exclude(student_id__in=student_ids).delete()
+    return ResultSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['student'],
+        update_fields=['institution', 'register_number', 'payload', 'published_at'],
+    )
+
+
+def publish_student(student):
+    snapshots = refresh_snapshots([student.id])
+    return snapshots[0] if snapshots else None
+
+
+def publish_institution(institution):
+    """Publish snapshots for every student of an institution. Returns the count."""
+    student_ids = list(Student.objects.filter(institution=institution).values_list('id', flat=True))
+    refresh_snapshots(student_ids)
+    return len(student_ids)
+
+
+def current_snapshots(institution, student_class=None):
+    """
+    Published snapshots of an institution (or one class of it), sorted by
+    register number, publishing missing or stale ones first.
+    """
+    snapshots = ResultSnapshot.objects.filter(institution=institution)
+    students = Student.objects.filter(institution=institution)
+    if student_class is not None:
+        snapshots = snapshots.filter(student__student_class=student_class)
+        students = students.filter(student_class=student_class)
+    snapshots = {s.student_id: s for s in snapshots}
+    outdated = [
+        sid for sid in students.values_list('id', flat=True)
+        if sid not in snapshots or is_snapshot_stale(snapshots[sid], institution)
+    ]
+    for snapshot in refresh_snapshots(outdated):
+        snapshots[snapshot.student_id] = snapshot
+    return sorted(snapshots.values(), key=lambda s: s.register_number)
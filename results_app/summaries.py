@@ -0,0 +1,174 @@
+"""
+Exam summary tables maintained incrementally from Result writes.
+
+StudentExamSummary holds each student's total, subject count, fail flag and
+ranks for an exam (computed by the ranking engine); ClassExamSummary holds the class mean, pass count and
+topper total. Both are refreshed for just the affected students (and their
+classes) whenever results change, so rank lists, toppers and dashboards read
+them instead of re-aggregating marks.
+"""
+from django.db.models import Sum, Count, Q
+
+from .grading import pass_percentage
+from .matrix import SUNNI_BOARD_PASS_MARK
+from .models import Institution, Student, Subject, Result, StudentExamSummary, ClassExamSummary
+from .ranking import rank_class
+
+
+def is_passing(total, max_total, has_failed_subject, grading_key):
+    if has_failed_subject or not max_total:
+        return False
+    return (total / max_total) * 100 >= pass_percentage(grading_key, is_total=True)
+
+
+def refresh_student_summaries(student_ids, exam_ids=None):
+    """
+    Recompute the StudentExamSummary rows of the given students (optionally
+    limited to some exams), then the ranks and ClassExamSummary of every
+    class/exam they belong to or just left.
+    """
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    results = Result.objects.filter(student_id__in=student_ids, exam__isnull=False)
+    existing = StudentExamSummary.objects.filter(student_id__in=student_ids)
+    if exam_ids is not None:
+        results = results.filter(exam_id__in=exam_ids)
+        existing = existing.filter(exam_id__in=exam_ids)
+
+    existing = list(existing.values_list('id', 'student_id', 'exam_id', 'exam__institution_id', 'student_class'))
+    classes = {(institution_id, student_class, exam_id) for _, _, exam_id, institution_id, student_class in existing}
+
+    rows = list(results.values(
+        'student_id', 'exam_id', 'student__student_class', 'student__institution_id', 'student__institution__grading_system',
+    ).annotate(
+        total=Sum('marks'),
+        entered=Count('id'),
+        failed=Count('id', filter=Q(marks__lt=SUNNI_BOARD_PASS_MARK)),
+    ))
+    institution_ids = {row['student__institution_id'] for row in rows}
+    grading_keys = {
+        institution.id: institution.grading_key
+        for institution in Institution.objects.filter(id__in=institution_ids).select_related('grading_scheme')
+    }
+    # Totals are out of every subject the class takes, entered or not.
+    class_subjects = {
+        (row['institution_id'], row['student_class']): row['count']
+        for row in Subject.objects.filter(institution_id__in=institution_ids).values(
+            'institution_id', 'student_class',
+        ).annotate(count=Count('id')).order_by()
+    }
+    summaries = []
+    for row in rows:
+        institution_id = row['student__institution_id']
+        grading_system = row['student__institution__grading_system']
+        has_failed_subject = grading_system == 'SUNNI_BOARD' and row['failed'] > 0
+        subject_count = class_subjects.get((institution_id, row['student__student_class']), 0)
+        max_total = max(subject_count, row['entered']) * 100
+        summaries.append(StudentExamSummary(
+            student_id=row['student_id'],
+            exam_id=row['exam_id'],
+            student_class=row['student__student_class'],
+            total=row['total'],
+            max_total=max_total,
+            subjects_entered=row['entered'],
+            has_failed_subject=has_failed_subject,
+            is_passed=is_passing(row['total'], max_total, has_failed_subject, grading_keys[institution_id]),
+        ))
+        classes.add((institution_id, row['student__student_class'], row['exam_id']))
+
+    if summaries:
+        StudentExamSummary.objects.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['student', 'exam'],
+            update_fields=['student_class', 'total', 'max_total', 'subjects_entered', 'has_failed_subject', 'is_passed'],
+        )
+    current = {(s.student_id, s.exam_id) for s in summaries}
+    stale_ids = [pk for pk, student_id, exam_id, _, _ in existing if (student_id, exam_id) not in current]
+    if stale_ids:
+        StudentExamSummary.objects.filter(id__in=stale_ids).delete()
+
+    for institution_id, student_class, exam_id in classes:
+        refresh_class_summary(institution_id, student_class, exam_id)
+
+
+def refresh_class_summary(institution_id, student_class, exam_id):
+    summaries = list(StudentExamSummary.objects.filter(exam_id=exam_id, student_class=student_class))
+    if not summaries:
+        ClassExamSummary.objects.filter(institution_id=institution_id, student_class=student_class, exam_id=exam_id).delete()
+        return None
+
+    grading_system = Institution.objects.filter(id=institution_id).values_list('grading_system', flat=True).first()
+    ranks = rank_class(exam_id, student_class, exclude_failed=grading_system == 'SUNNI_BOARD')
+    changed = []
+    for summary in summaries:
+        rank, dense_rank, division_rank = ranks.get(summary.student_id, (None, None, None))
+        if (summary.rank, summary.dense_rank, summary.division_rank) != (rank, dense_rank, division_rank):
+            summary.rank, summary.dense_rank, summary.division_rank = rank, dense_rank, division_rank
+            changed.append(summary)
+    if changed:
+        StudentExamSummary.objects.bulk_update(changed, ['rank', 'dense_rank', 'division_rank'])
+
+    summary, _ = ClassExamSummary.objects.update_or_create(
+        institution_id=institution_id,
+        student_class=student_class,
+        exam_id=exam_id,
+        defaults={
+            'student_count': len(summaries),
+            'mean': sum(s.total for s in summaries) / len(summaries),
+            'pass_count': sum(1 for s in summaries if s.is_passed),
+            'topper_total': max((s.total for s in summaries if s.rank is not None), default=None),
+        },
+    )
+    return summary
+
+
+def rebuild_exam_summaries(exam, student_class=None):
+    """Backfill/repair every summary of an exam, or of one class in it."""
+    students = Student.objects.filter(institution_id=exam.institution_id)
+    if student_class is not None:
+        students = students.filter(student_class=student_class)
+    student_ids = set(students.filter(results__exam=exam).values_list('id', flat=True))
+    stale = StudentExamSummary.objects.filter(exam=exam)
+    if student_class is not None:
+        stale = stale.filter(student_class=student_class)
+    student_ids.update(stale.values_list('student_id', flat=True))
+    refresh_student_summaries(student_ids, [exam.id])
+
+
+def get_class_summary(institution, class_num, exam):
+    """
+    The ClassExamSummary of a class and exam, built on first use for data
+    written before summaries existed. None when the class has no marks.
+    """
+    summary = ClassExamSummary.objects.filter(institution=institution, student_class=class_num, exam=exam).first()
+    if summary is None:
+        rebuild_exam_summaries(exam, student_class=class_num)
+        summary = ClassExamSummary.objects.filter(institution=institution, student_class=class_num, exam=exam).first()
+    return summary
+
+
+def ranked_students(institution, class_num, exam, max_rank=None):
+    """
+    Ranked students of a class for an exam, read from the summary tables.
+    Each student is annotated with `total_marks`, `rank`, `dense_rank` and
+    `division_rank`. With max_rank, only students ranked that high or
+    better are returned (so ties at the cut-off are all included).
+    """
+    if get_class_summary(institution, class_num, exam) is None:
+        return []
+    summaries = StudentExamSummary.objects.filter(
+        exam=exam, student_class=class_num, rank__isnull=False,
+    ).select_related('student').order_by('rank', 'student__name')
+    if max_rank is not None:
+        summaries = summaries.filter(rank__lte=max_rank)
+    students = []
+    for summary in summaries:
+        student = summary.student
+        student.total_marks = summary.total
+        student.rank = summary.rank
+        student.dense_rank = summary.dense_rank
+        student.division_rank = summary.division_rank
+        students.append(student)
+    return students
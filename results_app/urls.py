@@ -19,8 +19,14 @@ urlpatterns = [
     path('staff/class/<str:class_num>/', views.class_result_view, name='class_result'),
     path('staff/class/<str:class_num>/toppers/', views.toppers_view, name='toppers'),
     path('staff/class/<str:class_num>/ranklist/', views.rank_list_view, name='rank_list'),
+    path('staff/class/<str:class_num>/export/', views.export_class_results_view, name='export_class_results'),
+    path('staff/export/', views.export_institution_results_view, name='export_institution_results'),
+    path('staff/class/<str:class_num>/marksheets/', views.marksheets_view, name='class_marksheets'),
+    path('staff/marksheets/', views.marksheets_view, name='marksheets'),
     path('staff/upload/single/', views.single_upload_view, name='single_upload'),
     path('staff/upload/bulk/', views.bulk_upload_view, name='bulk_upload'),
+    path('staff/imports/<int:job_id>/', views.import_job_view, name='import_job'),
+    path('staff/imports/<int:job_id>/status/', views.import_job_status_view, name='import_job_status'),
     
     path('staff/add-student/', views.add_student_view, name='add_student'),
     path('staff/edit-student/<int:student_id>/', views.edit_student_view, name='edit_student'),
@@ -34,10 +40,15 @@ urlpatterns = [
     path('staff/manage-subjects/<str:class_num>/', views.manage_subjects_view, name='manage_subjects'),
     
     path('staff/edit-institution/', views.edit_institution_view, name='edit_institution'),
+    path('staff/grading-schemes/', views.manage_grading_schemes_view, name='manage_grading_schemes'),
+    path('staff/grading-schemes/<int:scheme_id>/', views.edit_grading_scheme_view, name='edit_grading_scheme'),
     
     path('staff/add-exam/', views.add_exam_view, name='add_exam'),
     path('staff/class/<str:class_num>/edit-marks/<int:student_id>/<int:exam_id>/', views.edit_student_marks_view, name='edit_student_marks'),
     path('staff/class/<str:class_num>/enter-marks/', views.enter_marks_view, name='enter_marks'),
+    path('staff/api/marks/', views.marks_autosave_view, name='marks_autosave'),
+    path('staff/analytics/', views.analytics_view, name='analytics'),
+    path('staff/analytics/data/', views.analytics_view, {'as_json': True}, name='analytics_data'),
     path('staff/class/<str:class_num>/pass-fail/', views.manage_pass_fail_view, name='manage_pass_fail'),
     path('staff/class/<str:class_num>/pass-fail-results/', views.class_result_pass_fail_view, name='class_result_pass_fail'),
 ]
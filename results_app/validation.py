@@ -0,0 +1,137 @@
+"""
+Dry-run validation of marks sheets.
+
+`validate_results` checks a whole sheet against the institution's data with
+vectorized pandas operations and reports, without writing anything, what an
+import would do: per-row errors (missing or duplicate register numbers,
+non-numeric or unknown classes, non-numeric or out-of-range marks, subjects
+that do not exist for the row's class) and a summary diff of new students
+and new, changed and unchanged marks.
+"""
+import numpy as np
+import pandas as pd
+
+from .importers import (
+    normalize_columns, subject_columns, clean_marks, valid_marks, _text, ImportFormatError,
+    CLASS_COLUMN, REGISTER_NUMBER_COLUMN, MARK_KEY, MAX_SUBJECT_MARKS,
+)
+from .models import Student, Subject, Result
+
+MAX_REPORTED_ROWS = 500
+
+
+class ValidationReport:
+    def __init__(self, errors, summary):
+        self.errors = errors
+        self.summary = summary
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    @property
+    def reported_errors(self):
+        """The first MAX_REPORTED_ROWS rows with errors, for display."""
+        return self.errors[:MAX_REPORTED_ROWS]
+
+
+def _issues(mask, frame, message):
+    """Long-format (row, register_number, message) records where `mask` holds."""
+    hits = frame[mask]
+    messages = message(hits) if callable(message) else message
+    return pd.DataFrame({'row': hits.index, 'register_number': hits['register_number'].values, 'message': messages})
+
+
+def validate_results(institution, exam, frames):
+    """
+    Validate marks sheet chunks for `exam` (which may be None for an exam that
+    does not exist yet). Returns a ValidationReport; nothing is written.
+    Raises ImportFormatError for a sheet without any rows.
+    """
+    frames = list(frames)
+    df = normalize_columns(pd.concat(frames)) if frames else None
+    if df is None or df.empty:
+        raise ImportFormatError('The sheet has no rows.')
+    subjects = subject_columns(df.columns)
+
+    register_numbers = _text(df[REGISTER_NUMBER_COLUMN])
+    raw_classes = df[CLASS_COLUMN].astype(str).str.strip()
+    classes = pd.to_numeric(raw_classes, errors='coerce')
+    sheet = pd.DataFrame({'register_number': register_numbers.fillna(''), 'raw_class': raw_classes}, index=df.index)
+
+    known_classes = set(Subject.objects.filter(institution=institution).values_list('student_class', flat=True))
+    known_classes.update(Student.objects.filter(institution=institution).values_list('student_class', flat=True))
+    known_subjects = set(Subject.objects.filter(institution=institution).values_list('name', 'student_class'))
+
+    missing_reg = register_numbers.isna()
+    bad_class = ~np.isfinite(classes)
+    unknown_class = ~bad_class & ~np.trunc(classes.fillna(0)).astype(int).isin(known_classes)
+    duplicated = ~missing_reg & register_numbers.duplicated(keep=False)
+    counts = register_numbers[duplicated].map(register_numbers[duplicated].value_counts())
+
+    issues = [
+        _issues(missing_reg, sheet, 'Missing register number.'),
+        _issues(bad_class, sheet, lambda hits: "Class '" + hits['raw_class'] + "' is not a number."),
+        _issues(unknown_class, sheet, lambda hits: 'Class ' + hits['raw_class'] + ' has no subjects or students.'),
+        _issues(duplicated, sheet, lambda hits: 'Register number appears ' + counts[hits.index].astype(str) + ' times in the sheet.'),
+    ]
+
+    valid = ~missing_reg & ~bad_class
+    rows = pd.DataFrame({
+        'register_number': register_numbers,
+        'student_class': np.trunc(classes.where(valid, 0)).astype(int),
+    }, index=df.index)[valid]
+
+    marks = clean_marks(df, rows, subjects)
+    if not marks.empty:
+        # melt() renumbers cells subject by subject; map them back to sheet rows.
+        marks['row'] = np.tile(rows.index.to_numpy(), len(subjects))[marks.index]
+        cells = marks.set_index('row')
+        non_numeric = cells['marks'].isna()
+        out_of_range = ~non_numeric & ~valid_marks(cells['marks'])
+        unknown_subject = ~pd.Series(
+            [key in known_subjects for key in zip(cells['subject'], cells['student_class'])], index=cells.index,
+        )
+        issues += [
+            _issues(non_numeric, cells, lambda hits: 'Marks for ' + hits['subject'] + ' are not a number.'),
+            _issues(out_of_range, cells, lambda hits: 'Marks for ' + hits['subject'] + ' must be between 0 and %d.' % MAX_SUBJECT_MARKS),
+            _issues(unknown_subject, cells, lambda hits: 'No subject ' + hits['subject'] + ' for class ' + hits['student_class'].astype(str) + '.'),
+        ]
+        marks = marks[~(non_numeric | out_of_range).to_numpy()]
+
+    issues = pd.concat(issues).groupby('row', sort=True).agg(
+        register_number=('register_number', 'first'), messages=('message', list),
+    )
+    errors = [
+        {'row': int(row), 'register_number': register_number, 'messages': messages}
+        for row, register_number, messages in zip(issues.index, issues['register_number'], issues['messages'])
+    ]
+
+    existing_students = set(Student.objects.filter(institution=institution).values_list('register_number', flat=True))
+    new_students = set(rows['register_number']) - existing_students
+
+    existing_marks = pd.DataFrame.from_records(
+        list(Result.objects.filter(exam=exam, student__institution=institution).values_list(
+            'student__register_number', 'subject__name', 'subject__student_class', 'marks',
+        )) if exam is not None else [],
+        columns=['register_number', 'subject', 'student_class', 'old_marks'],
+    ).astype({'old_marks': float})
+    marks = marks.drop_duplicates(MARK_KEY, keep='last')
+    compared = marks.merge(existing_marks, on=['register_number', 'subject', 'student_class'], how='left')
+    new_marks = compared['old_marks'].isna()
+    # Exact, as in ResultImporter._write_marks: any difference is written.
+    unchanged_marks = ~new_marks & (compared['marks'] == compared['old_marks'])
+    rows_with_changes = set(compared.loc[~unchanged_marks.to_numpy(), 'register_number']) | new_students
+
+    summary = {
+        'rows_read': len(df),
+        'rows_with_errors': len(errors),
+        'new_students': len(new_students),
+        'existing_students': len(set(rows['register_number']) & existing_students),
+        'new_marks': int(new_marks.sum()),
+        'changed_marks': int((~new_marks & ~unchanged_marks).sum()),
+        'unchanged_marks': int(unchanged_marks.sum()),
+        'unchanged_rows': int((~rows['register_number'].isin(rows_with_changes)).sum()),
+        'unknown_subjects': sorted({f'{name} (Class {c})' for name, c in zip(marks['subject'], marks['student_class']) if (name, c) not in known_subjects}),
+    }
+    return ValidationReport(errors, summary)
@@ -1,13 +1,30 @@
+import json
+import os
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import Student, Subject, Result, Institution, Exam
-from .forms import StudentSearchForm, SingleUploadForm, BulkUploadForm, InstitutionRegistrationForm, StudentForm, SubjectForm, InstitutionEditForm, StudentBulkUploadForm, ExamForm
+from .models import Student, Subject, Result, Institution, Exam, ResultSnapshot, GradingScheme, ClassExamSummary, ImportJob, PassFailRule
+from .forms import StudentSearchForm, SingleUploadForm, BulkUploadForm, InstitutionRegistrationForm, StudentForm, SubjectForm, InstitutionEditForm, StudentBulkUploadForm, ExamForm, GradingSchemeForm, GradingBandFormSet, PassFailRuleForm
 from django.contrib.auth import login as auth_login, logout as auth_logout
-from django.db import models, IntegrityError
-from django.db.models import Sum
+from django.db import IntegrityError
 from django.contrib.auth.forms import AuthenticationForm
-import pandas as pd
+from .snapshots import publish_student, is_snapshot_stale
+from .cache import get_cached_result_page, set_cached_result_page
+from .signals import batched_results_changes
+from .matrix import build_class_matrix
+from .summaries import ranked_students
+from .rank_index import add_class_ranks
+from .analytics import exam_statistics
+from .jobs import enqueue_import, job_status, resume_jobs
+from .readers import open_sheet, workbook_sheets, is_supported_file, SheetReadError, UNSUPPORTED_FILE_MESSAGE
+from .importers import ImportFormatError
+from .validation import validate_results
+from .exports import export_class_results, export_institution_results, XLSX_CONTENT_TYPE
+from .marksheets import generate_marksheets, stream_zip
+from .pass_fail import apply_rule, rule_outcomes, save_manual_results
+from .marks import MarksGrid, CellChangeError, apply_cell_changes, parse_mark, save_marks, save_versioned_marks
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 
 def register_institution(request):
     if request.method == 'POST':
@@ -112,41 +129,44 @@ def delete_institution_view(request, inst_id):
     return redirect('results_app:superadmin_dashboard')
 
 def student_result_view(request, inst_id):
-    institution = get_object_or_404(Institution, id=inst_id)
+    form = StudentSearchForm(request.GET or None)
+    searched = bool(request.GET) and form.is_valid()
+    # The page only varies by user through the navbar and pending messages,
+    # so anonymous lookups without messages share one cached copy per
+    # results version and skip the database entirely.
+    cacheable = searched and not request.user.is_authenticated and not messages.get_messages(request)
+    if cacheable:
+        content = get_cached_result_page(inst_id, form.cleaned_data['register_number'])
+        if content is not None:
+            return HttpResponse(content)
+
+    institution = get_object_or_404(Institution.objects.select_related('grading_scheme'), id=inst_id)
     if not institution.is_approved:
         messages.error(request, "This institution's portal is currently inactive.")
         return redirect('results_app:home')
         
-    form = StudentSearchForm(request.GET or None)
     results_by_exam = {}
     student = None
-    total_marks = 0
-    if request.GET and form.is_valid():
+    if searched:
         register_number = form.cleaned_data['register_number']
-        try:
-            student = Student.objects.get(institution=institution, register_number=register_number)
-            
-            if institution.grading_system == 'PASS_FAIL':
-                from .models import PassFailResult
-                results = PassFailResult.objects.filter(student=student).select_related('exam')
-                for r in results:
-                    exam_name = r.exam.name if r.exam else "General Exam"
-                    results_by_exam[exam_name] = {'is_passed': r.is_passed}
-            else:
-                results = student.results.select_related('exam', 'subject').all()
-                for r in results:
-                    exam_name = r.exam.name if r.exam else "General Exam"
-                    if exam_name not in results_by_exam:
-                        results_by_exam[exam_name] = {'marks': [], 'total': 0, 'max_total': 0, 'has_failed_subject': False}
-                    results_by_exam[exam_name]['marks'].append(r)
-                    results_by_exam[exam_name]['total'] += r.marks
-                    results_by_exam[exam_name]['max_total'] += 100
-                    
-                    if institution.grading_system == 'SUNNI_BOARD' and r.marks < 40:
-                        results_by_exam[exam_name]['has_failed_subject'] = True
-        except Student.DoesNotExist:
+        # Served from the published snapshot; students that were never
+        # published (or were published under another grading system) are
+        # published on first lookup.
+        snapshot = ResultSnapshot.objects.filter(institution=institution, register_number=register_number).first()
+        if snapshot is None or is_snapshot_stale(snapshot, institution):
+            try:
+                snapshot = publish_student(Student.objects.get(institution=institution, register_number=register_number))
+            except Student.DoesNotExist:
+                snapshot = None
+        if snapshot is not None:
+            student = snapshot.payload['student']
+            results_by_exam = {exam['name']: exam for exam in add_class_ranks(institution, snapshot.payload)}
+        else:
             messages.error(request, "Student not found in this institution. Please check your register number.")
-    return render(request, 'student_result.html', {'form': form, 'results_by_exam': results_by_exam, 'student': student, 'institution': institution})
+    response = render(request, 'student_result.html', {'form': form, 'results_by_exam': results_by_exam, 'student': student, 'institution': institution})
+    if cacheable and student is not None:
+        set_cached_result_page(institution.id, register_number, response.content)
+    return response
 
 @login_required
 def staff_dashboard_view(request):
@@ -157,7 +177,12 @@ def staff_dashboard_view(request):
     student_classes = set(Student.objects.filter(institution=institution).values_list('student_class', flat=True).distinct())
     subject_classes = set(Subject.objects.filter(institution=institution).values_list('student_class', flat=True).distinct())
     classes = student_classes.union(subject_classes)
-    return render(request, 'staff_dashboard.html', {'classes': sorted(list(classes)), 'institution': institution})
+    summaries_by_class = {}
+    for summary in ClassExamSummary.objects.filter(institution=institution).select_related('exam').order_by('exam__name'):
+        summaries_by_class.setdefault(summary.student_class, []).append(summary)
+    class_list = [(c, summaries_by_class.get(c, [])) for c in sorted(classes)]
+    exams = Exam.objects.filter(institution=institution).order_by('name')
+    return render(request, 'staff_dashboard.html', {'classes': sorted(list(classes)), 'class_list': class_list, 'institution': institution, 'exams': exams})
 
 @login_required
 def class_result_view(request, class_num):
@@ -175,31 +200,87 @@ def class_result_view(request, class_num):
     elif exams.exists():
         selected_exam = exams.first()
         
+    subjects = list(Subject.objects.filter(institution=institution, student_class=class_num))
+    data = []
     if selected_exam:
-        students = Student.objects.filter(institution=institution, student_class=class_num).annotate(
-            total_marks=Sum('results__marks', filter=models.Q(results__exam=selected_exam))
-        )
+        data = build_class_matrix(institution, class_num, selected_exam, subjects=subjects).rows()
+    return render(request, 'class_result.html', {'class_num': class_num, 'data': data, 'subjects': subjects, 'exams': exams, 'selected_exam': selected_exam, 'grading_key': institution.grading_key})
+
+@login_required
+def export_class_results_view(request, class_num):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return redirect('results_app:pending_approval')
+    institution = request.user.institution
+    exam = get_object_or_404(Exam, id=request.GET.get('exam') or 0, institution=institution)
+    workbook = export_class_results(institution, class_num, exam)
+    return FileResponse(
+        workbook, as_attachment=True, content_type=XLSX_CONTENT_TYPE,
+        filename=f"{institution.name} - Class {class_num} - {exam.name}.xlsx",
+    )
+
+@login_required
+def marksheets_view(request, class_num=None):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return redirect('results_app:pending_approval')
+    institution = request.user.institution
+    student_class = int(class_num) if class_num is not None and class_num.isdigit() else class_num
+    files, _, _, _ = generate_marksheets(institution, student_class=student_class)
+    name = f"{institution.name} - Class {class_num} - Marksheets.zip" if class_num is not None else f"{institution.name} - Marksheets.zip"
+    response = StreamingHttpResponse(
+        stream_zip((os.path.basename(path), path) for _, path in files),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = content_disposition_header(True, name)
+    return response
+
+@login_required
+def export_institution_results_view(request):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return redirect('results_app:pending_approval')
+    institution = request.user.institution
+    exam = get_object_or_404(Exam, id=request.GET.get('exam') or 0, institution=institution)
+    workbook = export_institution_results(institution, exam)
+    return FileResponse(
+        workbook, as_attachment=True, content_type=XLSX_CONTENT_TYPE,
+        filename=f"{institution.name} - {exam.name}.xlsx",
+    )
+
+@login_required
+def analytics_view(request, as_json=False):
+    # Staff see their own institution; the superadmin picks any approved one.
+    institutions = None
+    if request.user.is_superuser:
+        institutions = Institution.objects.filter(is_approved=True).order_by('name')
+        inst_id = request.GET.get('institution')
+        institution = get_object_or_404(institutions, id=inst_id) if inst_id else institutions.first()
+    elif hasattr(request.user, 'institution') and request.user.institution.is_approved:
+        institution = request.user.institution
     else:
-        students = Student.objects.none()
-        
-    subjects = Subject.objects.filter(institution=institution, student_class=class_num)
-    max_total = subjects.count() * 100
-    # Organize data for table
-    data = []
-    for s in students:
-        student_results = Result.objects.filter(student=s, exam=selected_exam)
-        res_dict = {r.subject.name: r.marks for r in student_results}
-        
-        has_failed_subject = False
-        marks_list = []
-        for sub in subjects:
-            mark = res_dict.get(sub.name, "-")
-            marks_list.append(mark)
-            if institution.grading_system == 'SUNNI_BOARD' and mark != "-" and mark < 40:
-                has_failed_subject = True
-            
-        data.append({'student': s, 'marks': marks_list, 'total': s.total_marks or 0, 'max_total': max_total, 'has_failed_subject': has_failed_subject})
-    return render(request, 'class_result.html', {'class_num': class_num, 'data': data, 'subjects': subjects, 'exams': exams, 'selected_exam': selected_exam})
+        if as_json:
+            return JsonResponse({'error': 'Not allowed'}, status=403)
+        return redirect('results_app:pending_approval')
+
+    exams = Exam.objects.filter(institution=institution).order_by('name') if institution else Exam.objects.none()
+    classes = sorted(set(Subject.objects.filter(institution=institution).values_list('student_class', flat=True))) if institution else []
+    exam_id = request.GET.get('exam')
+    selected_exam = get_object_or_404(exams, id=exam_id) if exam_id else exams.first()
+    class_num = request.GET.get('class')
+    selected_class = int(class_num) if class_num and class_num.isdigit() else None
+
+    stats = exam_statistics(institution, selected_exam, selected_class) if selected_exam else None
+    if as_json:
+        if stats is None:
+            return JsonResponse({'error': 'No exam found.'}, status=404)
+        return JsonResponse(stats)
+    return render(request, 'analytics.html', {
+        'institution': institution,
+        'institutions': institutions,
+        'exams': exams,
+        'classes': classes,
+        'selected_exam': selected_exam,
+        'selected_class': selected_class,
+        'stats': stats,
+    })
 
 @login_required
 def toppers_view(request, class_num):
@@ -217,18 +298,10 @@ def toppers_view(request, class_num):
     elif exams.exists():
         selected_exam = exams.first()
         
+    toppers = []
     if selected_exam:
-        students = Student.objects.filter(institution=institution, student_class=class_num).annotate(
-            total_marks=Sum('results__marks', filter=models.Q(results__exam=selected_exam))
-        ).order_by('-total_marks')
-        
-        if institution.grading_system == 'SUNNI_BOARD':
-            students = students.exclude(results__exam=selected_exam, results__marks__lt=40)
-    else:
-        students = Student.objects.none()
-        
-    # Let's say top 3
-    toppers = students[:3]
+        # Let's say top 3 ranks; tied students share a rank
+        toppers = ranked_students(institution, class_num, selected_exam, max_rank=3)
     return render(request, 'toppers.html', {'toppers': toppers, 'class_num': class_num, 'exams': exams, 'selected_exam': selected_exam})
 
 @login_required
@@ -247,15 +320,9 @@ def rank_list_view(request, class_num):
     elif exams.exists():
         selected_exam = exams.first()
         
+    students = []
     if selected_exam:
-        students = Student.objects.filter(institution=institution, student_class=class_num).annotate(
-            total_marks=Sum('results__marks', filter=models.Q(results__exam=selected_exam))
-        ).order_by('-total_marks')
-        
-        if institution.grading_system == 'SUNNI_BOARD':
-            students = students.exclude(results__exam=selected_exam, results__marks__lt=40)
-    else:
-        students = Student.objects.none()
+        students = ranked_students(institution, class_num, selected_exam)
         
     return render(request, 'rank_list.html', {'students': students, 'class_num': class_num, 'exams': exams, 'selected_exam': selected_exam})
 
@@ -297,101 +364,57 @@ def bulk_upload_view(request):
             excel_file = form.cleaned_data['file']
             exam_name = form.cleaned_data['exam_name']
             
-            from .models import Exam
-            exam_obj, _ = Exam.objects.get_or_create(institution=institution, name=exam_name)
-            
-            if not (excel_file.name.endswith('.xlsx') or excel_file.name.endswith('.xls')):
-                messages.error(request, 'Please upload a valid Excel file (.xlsx or .xls).')
+            if not is_supported_file(excel_file.name):
+                messages.error(request, UNSUPPORTED_FILE_MESSAGE)
                 return redirect('results_app:bulk_upload')
-                
-            try:
-                df = pd.read_excel(excel_file)
-                # Ensure all columns are treated as strings to avoid type issues
-                df = df.astype(str)
-                # Strip whitespace from column names
-                df.columns = df.columns.str.strip()
-                
-                header = df.columns.tolist()
-                
-                if 'Register Number' not in header or 'Name' not in header or 'Class' not in header:
-                    messages.error(request, 'The Excel file must contain "Register Number", "Name", and "Class" columns.')
+
+            if form.cleaned_data['dry_run']:
+                exam_obj = Exam.objects.filter(institution=institution, name=exam_name).first()
+                try:
+                    sheets = workbook_sheets(excel_file, excel_file.name) or [(None, 0)]
+                except SheetReadError as e:
+                    messages.error(request, str(e))
                     return redirect('results_app:bulk_upload')
-                    
-                fathers_name_col = "Father's Name" if "Father's Name" in header else None
-                division_col = "Division" if "Division" in header else None
-                
-                # Determine which columns are subjects
-                fixed_cols = ['Register Number', 'Name', 'Class']
-                if fathers_name_col: fixed_cols.append(fathers_name_col)
-                if division_col: fixed_cols.append(division_col)
-                    
-                subjects = [c for c in header if c not in fixed_cols and "Unnamed" not in str(c)]
-                    
-                for index, row in df.iterrows():
-                    reg = row['Register Number'].strip()
-                    if reg == 'nan' or not reg: continue
-                    
-                    class_val_str = row['Class'].strip()
-                    if class_val_str == 'nan' or not class_val_str: continue
+                reports = []
+                for sheet_name, _ in sheets:
+                    excel_file.seek(0)
                     try:
-                        class_num = int(float(class_val_str))
-                    except ValueError:
-                        continue # Skip invalid class numbers
-                    
-                    name = row['Name'].strip() if str(row['Name']) != 'nan' else ''
-                    fathers_name = row[fathers_name_col].strip() if fathers_name_col and str(row[fathers_name_col]) != 'nan' else None
-                    division = row[division_col].strip() if division_col and str(row[division_col]) != 'nan' else None
-                    
-                    student, _ = Student.objects.get_or_create(
-                        institution=institution,
-                        register_number=reg, 
-                        defaults={
-                            'name': name, 
-                            'student_class': class_num,
-                            'fathers_name': fathers_name,
-                            'division': division
-                        }
-                    )
-                    
-                    # Update fields if changed
-                    updated = False
-                    if fathers_name and student.fathers_name != fathers_name:
-                        student.fathers_name = fathers_name
-                        updated = True
-                    if division and student.division != division:
-                        student.division = division
-                        updated = True
-                    if updated:
-                        student.save()
-                    
-                    # Update marks
-                    for sub_name in subjects:
-                        # Fetch / Create subject for this specific student's class
-                        sub, _ = Subject.objects.get_or_create(institution=institution, name=sub_name.strip(), student_class=class_num)
-                        
-                        mark_val = str(row[sub_name]).strip()
-                        if mark_val and mark_val != 'nan':
-                            try:
-                                float_mark = float(mark_val)
-                                Result.objects.update_or_create(
-                                    student=student,
-                                    subject=sub,
-                                    exam=exam_obj,
-                                    defaults={'marks': float_mark}
-                                )
-                            except ValueError:
-                                pass # Skip invalid mark values
-                                
-                messages.success(request, 'Bulk upload successful!')
-                return redirect('results_app:staff_dashboard')
-            except Exception as e:
-                messages.error(request, f'Error processing file: {str(e)}')
-                return redirect('results_app:bulk_upload')
+                        report = validate_results(institution, exam_obj, open_sheet(excel_file, excel_file.name, sheet_name).chunks())
+                        reports.append({'sheet': sheet_name if len(sheets) > 1 else None, 'report': report})
+                    except (ImportFormatError, SheetReadError) as e:
+                        reports.append({'sheet': sheet_name, 'error': str(e)})
+                return render(request, 'bulk_upload.html', {'form': form, 'reports': reports})
+
+            exam_obj, _ = Exam.objects.get_or_create(institution=institution, name=exam_name)
+            job, created = enqueue_import(institution, 'RESULTS', excel_file, exam=exam_obj)
+            if created:
+                messages.info(request, 'Upload received. Your results are being processed.')
+            else:
+                messages.info(request, 'This file was already uploaded; showing that upload instead of importing it again.')
+            return redirect('results_app:import_job', job_id=job.id)
                 
     else:
         form = BulkUploadForm()
     return render(request, 'bulk_upload.html', {'form': form})
 
+@login_required
+def import_job_view(request, job_id):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return redirect('results_app:pending_approval')
+    job = get_object_or_404(ImportJob, id=job_id, institution=request.user.institution)
+    if not job.is_finished:
+        resume_jobs()
+    return render(request, 'import_job.html', {'job': job, 'status': job_status(job)})
+
+@login_required
+def import_job_status_view(request, job_id):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return JsonResponse({'error': 'Not allowed'}, status=403)
+    job = get_object_or_404(ImportJob, id=job_id, institution=request.user.institution)
+    if not job.is_finished:
+        resume_jobs()
+    return JsonResponse(job_status(job))
+
 @login_required
 def add_student_view(request):
     if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
@@ -439,7 +462,8 @@ def delete_student_view(request, student_id):
     student = get_object_or_404(Student, id=student_id, institution=institution)
     class_num = student.student_class
     if request.method == 'POST':
-        student.delete()
+        with batched_results_changes():
+            student.delete()
         messages.success(request, 'Student deleted successfully.')
         return redirect('results_app:manage_students', class_num=class_num)
     return render(request, 'confirm_delete.html', {'object': student, 'cancel_url': f"/manage-students/{class_num}/"})
@@ -461,52 +485,16 @@ def bulk_add_students_view(request):
         form = StudentBulkUploadForm(request.POST, request.FILES)
         if form.is_valid():
             excel_file = form.cleaned_data['file']
-            if not (excel_file.name.endswith('.xlsx') or excel_file.name.endswith('.xls')):
-                messages.error(request, 'Please upload a valid Excel file (.xlsx or .xls).')
+            if not is_supported_file(excel_file.name):
+                messages.error(request, UNSUPPORTED_FILE_MESSAGE)
                 return redirect('results_app:bulk_add_students')
             
-            try:
-                df = pd.read_excel(excel_file)
-                df = df.astype(str)
-                df.columns = df.columns.str.strip()
-                header = df.columns.tolist()
-                
-                if 'Register Number' not in header or 'Name' not in header or 'Class' not in header:
-                    messages.error(request, 'The Excel file must contain "Register Number", "Name", and "Class" columns.')
-                    return redirect('results_app:bulk_add_students')
-                
-                fathers_name_col = "Father's Name" if "Father's Name" in header else None
-                division_col = "Division" if "Division" in header else None
-                
-                for index, row in df.iterrows():
-                    reg = row['Register Number'].strip()
-                    if reg == 'nan' or not reg: continue
-                    class_val_str = row['Class'].strip()
-                    if class_val_str == 'nan' or not class_val_str: continue
-                    try:
-                        class_num = int(float(class_val_str))
-                    except ValueError:
-                        continue
-                        
-                    name = row['Name'].strip() if str(row['Name']) != 'nan' else ''
-                    fathers_name = row[fathers_name_col].strip() if fathers_name_col and str(row[fathers_name_col]) != 'nan' else None
-                    division = row[division_col].strip() if division_col and str(row[division_col]) != 'nan' else None
-                    
-                    student, created = Student.objects.update_or_create(
-                        institution=institution,
-                        register_number=reg,
-                        defaults={
-                            'name': name,
-                            'student_class': class_num,
-                            'fathers_name': fathers_name,
-                            'division': division
-                        }
-                    )
-                messages.success(request, 'Bulk students added successfully!')
-                return redirect('results_app:staff_dashboard')
-            except Exception as e:
-                messages.error(request, f'Error processing file: {str(e)}')
-                return redirect('results_app:bulk_add_students')
+            job, created = enqueue_import(institution, 'STUDENTS', excel_file, remove_missing=form.cleaned_data['remove_missing'])
+            if created:
+                messages.info(request, 'Upload received. Your students are being processed.')
+            else:
+                messages.info(request, 'This file was already uploaded; showing that upload instead of importing it again.')
+            return redirect('results_app:import_job', job_id=job.id)
     else:
         form = StudentBulkUploadForm()
     return render(request, 'bulk_add_students.html', {'form': form})
@@ -552,7 +540,8 @@ def delete_subject_view(request, subject_id):
     subject = get_object_or_404(Subject, id=subject_id, institution=institution)
     class_num = subject.student_class
     if request.method == 'POST':
-        subject.delete()
+        with batched_results_changes():
+            subject.delete()
         messages.success(request, 'Subject deleted successfully.')
         return redirect('results_app:manage_subjects', class_num=class_num)
     return render(request, 'confirm_delete.html', {'object': subject, 'cancel_url': f"/manage-subjects/{class_num}/"})
@@ -580,6 +569,46 @@ def edit_institution_view(request):
         form = InstitutionEditForm(instance=institution)
     return render(request, 'edit_institution.html', {'form': form})
 
+@login_required
+def manage_grading_schemes_view(request):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return redirect('results_app:pending_approval')
+    institution = request.user.institution
+    if request.method == 'POST':
+        form = GradingSchemeForm(request.POST)
+        if form.is_valid():
+            scheme = form.save(commit=False)
+            scheme.institution = institution
+            try:
+                scheme.save()
+                messages.success(request, 'Grading scheme created. Now add its grade bands.')
+                return redirect('results_app:edit_grading_scheme', scheme_id=scheme.id)
+            except IntegrityError:
+                messages.error(request, 'A grading scheme with this name already exists.')
+    else:
+        form = GradingSchemeForm()
+    schemes = GradingScheme.objects.filter(institution=institution).order_by('name')
+    return render(request, 'manage_grading_schemes.html', {'form': form, 'schemes': schemes, 'institution': institution})
+
+@login_required
+def edit_grading_scheme_view(request, scheme_id):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return redirect('results_app:pending_approval')
+    institution = request.user.institution
+    scheme = get_object_or_404(GradingScheme, id=scheme_id, institution=institution)
+    if request.method == 'POST':
+        form = GradingSchemeForm(request.POST, instance=scheme)
+        formset = GradingBandFormSet(request.POST, instance=scheme)
+        if form.is_valid() and formset.is_valid():
+            form.save()
+            formset.save()
+            messages.success(request, 'Grading scheme updated successfully.')
+            return redirect('results_app:edit_grading_scheme', scheme_id=scheme.id)
+    else:
+        form = GradingSchemeForm(instance=scheme)
+        formset = GradingBandFormSet(instance=scheme)
+    return render(request, 'edit_grading_scheme.html', {'form': form, 'formset': formset, 'scheme': scheme})
+
 @login_required
 def add_exam_view(request):
     if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
@@ -615,25 +644,16 @@ def edit_student_marks_view(request, class_num, student_id, exam_id):
     result_dict = {r.subject_id: r for r in existing_results}
     
     if request.method == 'POST':
+        # Validate every field before writing anything, then save the changes in one batch.
+        marks = {}
         for subject in subjects:
-            mark_value = request.POST.get(f'subject_{subject.id}', '').strip()
-            if mark_value:
-                try:
-                    float_mark = float(mark_value)
-                    Result.objects.update_or_create(
-                        student=student,
-                        subject=subject,
-                        exam=exam,
-                        defaults={'marks': float_mark}
-                    )
-                except ValueError:
-                    messages.error(request, f"Invalid mark entered for {subject.name}")
-                    return redirect('results_app:edit_student_marks', class_num=class_num, student_id=student.id, exam_id=exam.id)
-            else:
-                # If mark is empty, delete it if it exists
-                if subject.id in result_dict:
-                    result_dict[subject.id].delete()
-                    
+            try:
+                marks[(student.id, subject.id)] = parse_mark(request.POST.get(f'subject_{subject.id}'))
+            except ValueError:
+                messages.error(request, f"Invalid mark entered for {subject.name}")
+                return redirect('results_app:edit_student_marks', class_num=class_num, student_id=student.id, exam_id=exam.id)
+        save_marks(exam, marks, {(student.id, subject_id): r for subject_id, r in result_dict.items()})
+
         messages.success(request, 'Marks updated successfully.')
         return redirect(f"/staff/class/{class_num}/?exam={exam.id}")
         
@@ -667,8 +687,27 @@ def enter_marks_view(request, class_num):
     selected_exam = None
     selected_subject = None
     student_data = []
+    grid = None
 
-    if exam_id and subject_id:
+    if exam_id and subject_id == 'all':
+        # Grid mode: every subject of the class at once.
+        selected_exam = get_object_or_404(Exam, id=exam_id, institution=institution)
+        subjects = list(subjects)
+        grid = MarksGrid(institution, class_num, selected_exam, subjects)
+        if request.method == 'POST':
+            marks, invalid = grid.parse(request.POST)
+            for student, subject in invalid[:10]:
+                messages.error(request, f"Invalid mark entered for {student.name} in {subject.name}")
+            if len(invalid) > 10:
+                messages.error(request, f"{len(invalid) - 10} more invalid marks were not saved.")
+            saved, deleted, conflicts = grid.save(marks)
+            for student, subject in conflicts[:10]:
+                messages.warning(request, f"{student.name}'s mark in {subject.name} was changed by someone else since you opened the page and was not saved.")
+            if len(conflicts) > 10:
+                messages.warning(request, f"{len(conflicts) - 10} more marks changed by someone else were not saved.")
+            messages.success(request, f'Marks saved: {saved} updated, {deleted} cleared.')
+            return redirect(f"{request.path}?exam={selected_exam.id}&subject=all")
+    elif exam_id and subject_id:
         selected_exam = get_object_or_404(Exam, id=exam_id, institution=institution)
         selected_subject = get_object_or_404(Subject, id=subject_id, institution=institution, student_class=class_num)
         
@@ -681,38 +720,39 @@ def enter_marks_view(request, class_num):
         
         for student in students:
             existing_mark = ''
+            version = 0
             if student.current_results:
                 existing_mark = student.current_results[0].marks
+                version = student.current_results[0].version
             student_data.append({
                 'student': student,
-                'existing_mark': existing_mark
+                'existing_mark': existing_mark,
+                'version': version,
             })
             
     if request.method == 'POST' and selected_exam and selected_subject:
+        marks = {}
+        existing = {}
         for student_info in student_data:
             student = student_info['student']
-            mark_value = request.POST.get(f'mark_{student.id}', '').strip()
-            
-            if mark_value:
-                try:
-                    float_mark = float(mark_value)
-                    Result.objects.update_or_create(
-                        student=student,
-                        subject=selected_subject,
-                        exam=selected_exam,
-                        defaults={'marks': float_mark}
-                    )
-                except ValueError:
-                    messages.error(request, f"Invalid mark entered for {student.name}")
-                    continue
-            else:
-                # If mark is cleared, delete the existing record for this student
-                Result.objects.filter(
-                    student=student,
-                    subject=selected_subject,
-                    exam=selected_exam
-                ).delete()
-                
+            value = request.POST.get(f'mark_{student.id}')
+            if value is None:
+                # Unchanged cells are not posted.
+                continue
+            try:
+                mark = parse_mark(value)
+                version = int(request.POST.get(f'version_{student.id}', ''))
+            except ValueError:
+                messages.error(request, f"Invalid mark entered for {student.name}")
+                continue
+            marks[(student.id, selected_subject.id)] = (mark, version)
+            if student.current_results:
+                existing[(student.id, selected_subject.id)] = student.current_results[0]
+        _, _, conflicts = save_versioned_marks(selected_exam, marks, existing)
+        names = {info['student'].id: info['student'].name for info in student_data}
+        for student_id, _ in conflicts:
+            messages.warning(request, f"{names[student_id]}'s mark was changed by someone else since you opened the page and was not saved.")
+
         messages.success(request, 'Marks successfully saved/updated!')
         # Post/Redirect/Get pattern
         return redirect(f"{request.path}?exam={selected_exam.id}&subject={selected_subject.id}")
@@ -723,9 +763,27 @@ def enter_marks_view(request, class_num):
         'subjects': subjects,
         'selected_exam': selected_exam,
         'selected_subject': selected_subject,
-        'student_data': student_data
+        'student_data': student_data,
+        'grid_subjects': subjects if grid else None,
+        'grid_rows': grid.rows() if grid else None,
     })
 
+@login_required
+def marks_autosave_view(request):
+    if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
+        return JsonResponse({'error': 'Not allowed'}, status=403)
+    if request.method not in ('PATCH', 'POST'):
+        return JsonResponse({'error': 'Use PATCH with a JSON body.'}, status=405)
+    try:
+        changes = json.loads(request.body)['changes']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with a "changes" list.'}, status=400)
+    try:
+        outcome = apply_cell_changes(request.user.institution, changes)
+    except CellChangeError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(outcome, status=409 if outcome['conflicts'] and not outcome['saved'] else 200)
+
 @login_required
 def manage_pass_fail_view(request, class_num):
     if not hasattr(request.user, 'institution') or not request.user.institution.is_approved:
@@ -738,11 +796,36 @@ def manage_pass_fail_view(request, class_num):
         
     exams = Exam.objects.filter(institution=institution).order_by('name')
     exam_id = request.GET.get('exam')
+    exceptions_only = request.GET.get('exceptions') == '1'
+    action = request.POST.get('action') if request.method == 'POST' else None
     selected_exam = None
+    rule = None
+    rule_form = None
     student_data = []
 
     if exam_id:
         selected_exam = get_object_or_404(Exam, id=exam_id, institution=institution)
+        rule = PassFailRule.objects.filter(institution=institution, student_class=class_num, exam=selected_exam).first()
+
+        if action == 'delete_rule':
+            if rule:
+                rule.delete()
+            messages.success(request, 'Rule removed. The current results were kept.')
+            return redirect(f"{request.path}?exam={selected_exam.id}")
+        if action == 'apply_rule':
+            rule_form = PassFailRuleForm(request.POST, instance=rule)
+            if rule_form.is_valid():
+                rule = rule_form.save(commit=False)
+                rule.institution = institution
+                rule.student_class = class_num
+                rule.exam = selected_exam
+                rule.save()
+                counts = apply_rule(rule, reset_overrides=rule_form.cleaned_data['reset_overrides'])
+                messages.success(request, f"Rule applied: {counts['passed']} passed, {counts['failed']} failed, {counts['changed']} updated, {counts['overridden']} set by hand kept.")
+                return redirect(f"{request.path}?exam={selected_exam.id}&exceptions=1")
+        else:
+            rule_form = PassFailRuleForm(instance=rule)
+
         students = Student.objects.filter(institution=institution, student_class=class_num).order_by('name')
         
         from django.db.models import Prefetch
@@ -750,43 +833,47 @@ def manage_pass_fail_view(request, class_num):
         students = students.prefetch_related(
             Prefetch('pass_fail_results', queryset=PassFailResult.objects.filter(exam=selected_exam), to_attr='current_pf_results')
         )
+        outcomes = rule_outcomes(rule) if rule else {}
         
         for student in students:
+            current = student.current_pf_results[0] if student.current_pf_results else None
             status = ''
-            if student.current_pf_results:
-                status = 'passed' if student.current_pf_results[0].is_passed else 'failed'
+            if current:
+                status = 'passed' if current.is_passed else 'failed'
+            outcome = outcomes.get(student.id)
+            # With a rule in place, staff only need to look at students the
+            # rule fails or cannot decide, and at results set by hand.
+            is_exception = current is None or current.is_overridden or not outcome or not outcome['is_passed']
+            if exceptions_only and rule and not is_exception:
+                continue
             student_data.append({
                 'student': student,
-                'status': status
+                'status': status,
+                'result': current,
+                'outcome': outcome,
+                'is_exception': is_exception,
+                'following_rule': rule is not None and current is not None and not current.is_overridden,
             })
             
-    if request.method == 'POST' and selected_exam:
-        from .models import PassFailResult
+    if action == 'save_results' and selected_exam:
+        statuses = {}
         for student_info in student_data:
-            student = student_info['student']
-            status_val = request.POST.get(f'status_{student.id}')
-            
-            if status_val in ['passed', 'failed']:
-                is_passed = (status_val == 'passed')
-                PassFailResult.objects.update_or_create(
-                    student=student,
-                    exam=selected_exam,
-                    defaults={'is_passed': is_passed}
-                )
-            else:
-                PassFailResult.objects.filter(
-                    student=student,
-                    exam=selected_exam
-                ).delete()
+            status_val = request.POST.get(f"status_{student_info['student'].id}")
+            statuses[student_info['student'].id] = {'passed': True, 'failed': False}.get(status_val)
+        existing = {info['student'].id: info['result'] for info in student_data if info['result']}
+        save_manual_results(selected_exam, statuses, existing, rule)
                 
         messages.success(request, 'Pass/Fail results successfully saved/updated!')
-        return redirect(f"{request.path}?exam={selected_exam.id}")
+        return redirect(request.get_full_path())
 
     return render(request, 'manage_pass_fail.html', {
         'class_num': class_num,
         'exams': exams,
         'selected_exam': selected_exam,
-        'student_data': student_data
+        'student_data': student_data,
+        'rule': rule,
+        'rule_form': rule_form,
+        'exceptions_only': exceptions_only,
     })
 
 @login_required